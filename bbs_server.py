@@ -1,14 +1,70 @@
 import asyncio
+import bisect
+import codecs
+import collections
+import contextvars
+import cProfile
 import datetime
+import functools
+import hashlib
+import ipaddress
+import itertools
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import random
 import sqlite3
 import bcrypt
 import textwrap
 import signal
 import sys
+import threading
+import time
+import traceback
+import unicodedata
+import zlib
 
 DB_PATH = os.getenv("BBS_DB_PATH", "./data/bbs.sqlite3")
 BBS_PORT = int(os.getenv("BBS_PORT", "2323"))
+WHO_PAGE_SIZE = int(os.getenv("BBS_WHO_PAGE_SIZE", "20"))
+READ_PAGE_SIZE = int(os.getenv("BBS_READ_PAGE_SIZE", "10"))
+READ_MARK_BATCH = int(os.getenv("BBS_READ_MARK_BATCH", "50"))
+READ_MARK_FLUSH_SECS = float(os.getenv("BBS_READ_MARK_FLUSH_SECS", "30"))
+MESSAGE_CACHE_SIZE = int(os.getenv("BBS_MESSAGE_CACHE_SIZE", "4096"))
+BOARD_LATEST_ROWS = max(int(os.getenv("BBS_BOARD_CACHE_ROWS", "50")), READ_PAGE_SIZE + 1)
+DEFAULT_BOARD_ID = 1
+COMPRESS_MIN_BYTES = int(os.getenv("BBS_COMPRESS_MIN_BYTES", "512"))
+COMPRESS_LEVEL = 6
+MAX_MESSAGE_BYTES = int(os.getenv("BBS_MAX_MESSAGE_SIZE", "4096"))
+MAX_LINE_BYTES = int(os.getenv("BBS_MAX_LINE_SIZE", "8192"))
+POST_RATE_LIMIT = int(os.getenv("BBS_POST_RATE_LIMIT", "10"))         # posts per window
+POST_RATE_WINDOW = float(os.getenv("BBS_POST_RATE_WINDOW", "30"))    # seconds
+DUPLICATE_WINDOW = float(os.getenv("BBS_DUPLICATE_WINDOW", "300"))   # seconds
+WRAP_CACHE_SIZE = int(os.getenv("BBS_WRAP_CACHE_SIZE", "8192"))
+TELNET_NAWS = os.getenv("BBS_TELNET_NAWS", "1") == "1"
+TELNET_CHARSET = os.getenv("BBS_TELNET_CHARSET", "1") == "1"
+DEFAULT_CHARSET = os.getenv("BBS_DEFAULT_CHARSET", "utf-8")
+SCREEN_CACHE_SIZE = int(os.getenv("BBS_SCREEN_CACHE_SIZE", "8192"))
+PUSH_MODE = os.getenv("BBS_PUSH_MODE", "notify")          # notify | post | off
+PUSH_POLICY = os.getenv("BBS_PUSH_POLICY", "drop-oldest")  # drop-oldest | coalesce
+PUSH_QUEUE_SIZE = int(os.getenv("BBS_PUSH_QUEUE_SIZE", "32"))
+METRICS_HOST = os.getenv("BBS_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("BBS_METRICS_PORT", "0"))  # 0 disables the listener
+ADMIN_PORT = int(os.getenv("BBS_ADMIN_PORT", "0"))      # 0 disables; always bound to 127.0.0.1
+LAG_THRESHOLD_MS = float(os.getenv("BBS_LAG_THRESHOLD_MS", "100"))  # 0 disables the watchdog
+LAG_INTERVAL = float(os.getenv("BBS_LAG_INTERVAL", "0.1"))             # heartbeat period, seconds
+PROFILE_DIR = os.getenv("BBS_PROFILE_DIR", "./data/profiles")
+PROFILE_MODE = os.getenv("BBS_PROFILE_MODE", "cprofile")   # cprofile | sample
+PROFILE_SECONDS = float(os.getenv("BBS_PROFILE_SECONDS", "30"))
+PROFILE_SAMPLE_HZ = float(os.getenv("BBS_PROFILE_SAMPLE_HZ", "100"))
+LOG_LEVEL = os.getenv("BBS_LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("BBS_LOG_SAMPLE_RATE", "0.1"))  # share of per-action events logged
+TRACE_FILE = os.getenv("BBS_TRACE_FILE", "./data/trace.json")
+TRACE_SAMPLE_RATE = float(os.getenv("BBS_TRACE_SAMPLE_RATE", "0"))  # share of sessions traced
+RECORD_DIR = os.getenv("BBS_RECORD_DIR", "./data/transcripts")
+RECORD_SESSIONS = os.getenv("BBS_RECORD_SESSIONS", "0") == "1"  # record from startup
 
 ANSI_RESET  = "\x1b[0m"
 ANSI_GREEN  = "\x1b[32m"
@@ -26,123 +82,2201 @@ WELCOME = textwrap.dedent(f"""
 MAIN_MENU = textwrap.dedent(f"""
 {ANSI_GREEN}Main Menu{ANSI_RESET}
 [1] Read messages
+[N] Read new messages
 [2] Post a message
+[T] View thread / reply
+[S] Search messages
+[B] Change board
+[M] Private mail
+[C] Character set
 [3] Who's online
 [4] Log out
 
 Choice?> """)
 
+###############################################################################
+# Structured logging (JSON lines, written off the event loop)
+###############################################################################
+
+LOG = logging.getLogger("bbs")
+
+# Set per connection in session_task; each connection runs in its own task,
+# so every log line emitted on its behalf picks up its own id.
+SESSION_ID = contextvars.ContextVar("bbs_session_id", default=None)
+SESSION_IDS = itertools.count(1)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, event, sid, then event fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc)
+                  .isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        sid = getattr(record, "sid", None)
+        if sid is not None:
+            entry["sid"] = sid
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class _SessionQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread as-is. The stock prepare() formats
+    the message in the caller, which is exactly the work we want off the
+    event loop; only the session id has to be captured here.
+    """
+
+    def prepare(self, record):
+        record.sid = SESSION_ID.get()
+        return record
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    """
+    Route the "bbs" logger through a queue to a background listener that
+    formats and writes JSON lines. Returns the started QueueListener; stop
+    it at shutdown to flush what is still queued.
+    """
+    log_queue = queue.SimpleQueue()
+    output = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(log_queue, output)
+
+    for handler in list(LOG.handlers):
+        LOG.removeHandler(handler)
+    LOG.addHandler(_SessionQueueHandler(log_queue))
+    LOG.setLevel(level.upper() if isinstance(level, str) else level)
+    LOG.propagate = False
+    listener.start()
+    return listener
+
+def log_event(event, level=logging.INFO, sample=None, **fields):
+    """
+    Log one structured event. sample is the fraction of calls to keep for
+    high-volume events; kept lines carry sample_rate so counts can be scaled
+    back up. Dropped and disabled events cost a comparison, nothing more.
+    """
+    if not LOG.isEnabledFor(level):
+        return
+    if sample is not None:
+        if random.random() >= sample:
+            return
+        fields["sample_rate"] = sample
+    LOG.log(level, event, extra={"fields": fields})
+
+###############################################################################
+# Request tracing (sampled per session, Chrome trace event format)
+###############################################################################
+
+TRACE = logging.getLogger("bbs.trace")
+
+# True for the sessions picked by TRACE_SAMPLE_RATE; spans elsewhere are no-ops.
+TRACING = contextvars.ContextVar("bbs_tracing", default=False)
+
+class JsonMessageFormatter(logging.Formatter):
+    """The record's message, a dict, as one compact JSON value."""
+
+    def format(self, record):
+        return json.dumps(record.msg, separators=(",", ":"), default=str)
+
+def setup_tracing(path=TRACE_FILE):
+    """
+    Write trace events to path through a background listener, in the JSON
+    array form chrome://tracing and Perfetto load directly: "[" followed by
+    one event per line, each ending in "," (the closing "]" is optional).
+    Returns the started QueueListener.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    output = logging.FileHandler(path, encoding="utf-8")
+    output.terminator = ",\n"
+    output.setFormatter(JsonMessageFormatter())
+    if output.stream.tell() == 0:
+        output.stream.write("[\n")
+    trace_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(trace_queue, output)
+
+    for handler in list(TRACE.handlers):
+        TRACE.removeHandler(handler)
+    TRACE.addHandler(_SessionQueueHandler(trace_queue))
+    TRACE.setLevel(logging.INFO)
+    TRACE.propagate = False
+    listener.start()
+    return listener
+
+def trace_complete(name, cat, started, elapsed, args=None):
+    """Emit a complete ("X") event; the session id is the trace thread."""
+    event = {
+        "name": name, "cat": cat, "ph": "X",
+        "ts": round(started * 1e6, 1), "dur": round(elapsed * 1e6, 1),
+        "pid": os.getpid(), "tid": SESSION_ID.get() or 0,
+    }
+    if args:
+        event["args"] = args
+    TRACE.info(event)
+
+def trace_thread_name(label):
+    """Label the current session's track in the trace viewer."""
+    if TRACING.get():
+        TRACE.info({"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                    "tid": SESSION_ID.get() or 0, "args": {"name": label}})
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "started")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        trace_complete(self.name, self.cat, self.started, time.perf_counter() - self.started, self.args)
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+NO_SPAN = _NoSpan()
+
+def trace_span(name, cat="app", **args):
+    """Context manager timing its block as a span, if this session is traced."""
+    if not TRACING.get():
+        return NO_SPAN
+    return _Span(name, cat, args)
+
+###############################################################################
+# Metrics (Prometheus text exposition)
+###############################################################################
+
+METRIC_HELP = {
+    "bbs_menu_action_seconds": "Time spent in each main menu action, excluding waits for client input.",
+    "bbs_storage_seconds": "Duration of storage calls (they run on the event loop).",
+    "bbs_cache_lookups_total": "In-memory lookups in front of storage calls, by cache and hit or miss.",
+    "bbs_bcrypt_seconds": "Duration of bcrypt hash and check operations.",
+    "bbs_bytes_in_total": "Bytes received from clients.",
+    "bbs_bytes_out_total": "Bytes sent to clients.",
+    "bbs_connections_total": "Client connections accepted.",
+    "bbs_sessions": "Connected client sessions, including ones still logging in.",
+    "bbs_active_users": "Logged-in users.",
+    "bbs_push_subscribers": "Sessions subscribed to live push.",
+    "bbs_push_dropped_total": "Push events discarded or folded into a summary because a session's queue was full.",
+    "bbs_post_guard_total": "Posting flood control decisions.",
+    "bbs_loop_lag_seconds": "How late the event loop heartbeat woke up.",
+    "bbs_loop_stalls_total": "Times the event loop was blocked past the lag threshold.",
+}
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "started", "elapsed")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.metrics.observe(self.name, self.elapsed, **self.labels)
+
+    def exclude(self, seconds):
+        """Leave seconds spent inside the block out of the measurement."""
+        self.started += seconds
+
+class Metrics:
+    """
+    In-process counters, gauges and latency histograms, rendered in the
+    Prometheus text format. Collectors are callables polled at render time
+    for values owned elsewhere (hub, flood guard, presence index).
+    """
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.kinds = {}
+        self.values = collections.defaultdict(float)  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.collectors = []
+
+    def inc(self, name, value=1, **labels):
+        self.kinds.setdefault(name, "counter")
+        self.values[(name, tuple(sorted(labels.items())))] += value
+
+    def add(self, name, value, **labels):
+        """Move a gauge up or down."""
+        self.kinds.setdefault(name, "gauge")
+        self.values[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self.histograms.get(key)
+        if hist is None:
+            self.kinds.setdefault(name, "histogram")
+            hist = self.histograms[key] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+        hist[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        hist[-1] += seconds
+
+    def time(self, name, **labels):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, name, labels)
+
+    def collector(self, func):
+        """Register func() -> iterable of (name, kind, labels dict, value)."""
+        self.collectors.append(func)
+        return func
+
+    def clear(self):
+        self.values.clear()
+        self.histograms.clear()
+
+    def render(self):
+        families = collections.defaultdict(list)
+        for (name, labels), value in self.values.items():
+            families[name].append(_sample(name, labels, value))
+        for (name, labels), hist in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + ("+Inf",), hist):
+                cumulative += count
+                families[name].append(_sample(name + "_bucket", labels + (("le", bound),), cumulative))
+            families[name].append(_sample(name + "_sum", labels, hist[-1]))
+            families[name].append(_sample(name + "_count", labels, cumulative))
+        kinds = dict(self.kinds)
+        for func in self.collectors:
+            for name, kind, labels, value in func():
+                kinds.setdefault(name, kind)
+                families[name].append(_sample(name, tuple(sorted(labels.items())), value))
+
+        out = []
+        for name in sorted(families):
+            if name in METRIC_HELP:
+                out.append(f"# HELP {name} {METRIC_HELP[name]}")
+            out.append(f"# TYPE {name} {kinds.get(name, 'untyped')}")
+            out.extend(families[name])
+        return "\n".join(out) + "\n"
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _sample(name, labels, value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if not labels:
+        return f"{name} {value}"
+    pairs = ",".join(f'{key}="{_label_value(val)}"' for key, val in labels)
+    return f"{name}{{{pairs}}} {value}"
+
+METRICS = Metrics()
+
+def timed(name):
+    """
+    Decorator recording each call's duration, labeled op=<function name>,
+    and a "db" span when the session is traced.
+    """
+    def decorate(func):
+        op = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                METRICS.observe(name, elapsed, op=op)
+                if TRACING.get():
+                    trace_complete(op, "db", started, elapsed)
+        return wrapper
+    return decorate
+
+async def metrics_handler(reader, writer):
+    """Minimal HTTP/1.0 responder: GET /metrics, anything else is a 404."""
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        while True:
+            header = await asyncio.wait_for(reader.readline(), timeout=5)
+            if header in (b"\r\n", b"\n", b""):
+                break
+        parts = request.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", METRICS.render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.0 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode("ascii") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+###############################################################################
+# Event loop lag watchdog
+###############################################################################
+
+class LoopWatchdog:
+    """
+    Detects blocking calls on the event loop. A heartbeat task records how
+    late each of its sleeps wakes up; a daemon thread notices when the
+    heartbeat stops ticking for longer than the threshold and samples the
+    loop thread's stack with sys._current_frames(), once per stall, so the
+    report names the call that is blocking while it is still blocking.
+    """
+
+    STACK_LIMIT = 12
+
+    def __init__(self, threshold=LAG_THRESHOLD_MS / 1000, interval=LAG_INTERVAL, history=20):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = collections.deque(maxlen=history)
+        self.max_lag = 0.0
+        self._last_beat = time.monotonic()
+        self._stalled = False
+        self._loop_thread_id = None
+        self._loop = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._loop = asyncio.get_running_loop()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+        if self._thread is not None:
+            self._thread.join()
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - started - self.interval, 0.0)
+            self._last_beat = time.monotonic()
+            self.max_lag = max(self.max_lag, lag)
+            METRICS.observe("bbs_loop_lag_seconds", lag)
+
+    def _watch(self):
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(poll):
+            blocked = time.monotonic() - self._last_beat - self.interval
+            if blocked < self.threshold:
+                self._stalled = False
+            elif not self._stalled:
+                self._stalled = True
+                self._sample(blocked)
+
+    def _sample(self, blocked):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame, limit=self.STACK_LIMIT)
+        del frame
+        self.stalls.append({"at": time.time(), "blocked": blocked, "stack": stack})
+        where = stack[-1]
+        # METRICS belongs to the loop thread (a scrape iterates its dicts),
+        # so the count is handed over and lands once the loop is free again.
+        self._loop.call_soon_threadsafe(functools.partial(
+            METRICS.inc, "bbs_loop_stalls_total",
+            function=f"{where.name} ({os.path.basename(where.filename)})"
+        ))
+        log_event("loop_blocked", logging.WARNING, blocked_ms=round(blocked * 1000),
+                  stack="".join(traceback.format_list(stack)))
+
+LOOP_WATCHDOG = LoopWatchdog()
+
+###############################################################################
+# On-demand profiler
+###############################################################################
+
+class Profiler:
+    """
+    Time-boxed profile of the running server, started and stopped from the
+    event loop (SIGUSR1 or an admin command). "cprofile" writes a pstats
+    file; "sample" polls the loop thread's stack from a side thread and
+    writes collapsed stacks ("a;b;c count" lines, for flamegraph tools).
+    Nothing is installed while no capture is running.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, mode=PROFILE_MODE, sample_hz=PROFILE_SAMPLE_HZ):
+        self.directory = directory
+        self.mode = mode
+        self.sample_hz = sample_hz
+        self.path = None
+        self._profile = None
+        self._samples = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._timer = None
+
+    @property
+    def running(self):
+        return self.path is not None
+
+    def start(self, seconds=PROFILE_SECONDS):
+        """Begin a capture that stops itself after seconds. Returns the output path."""
+        if self.running:
+            return self.path
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        suffix = "prof" if self.mode == "cprofile" else "folded"
+        self.path = os.path.join(self.directory, f"bbs-{stamp}-{os.getpid()}.{suffix}")
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._samples = collections.Counter()
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(
+                target=self._sample, args=(threading.get_ident(),), name="profiler", daemon=True
+            )
+            self._sampler.start()
+        self._timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+        log_event("profile_started", mode=self.mode, seconds=seconds, path=self.path)
+        return self.path
+
+    def stop(self):
+        """End the capture and write it out. Returns the path written, or None."""
+        if not self.running:
+            return None
+        path, self.path = self.path, None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(path)
+            self._profile = None
+        else:
+            self._stop_sampling.set()
+            self._sampler.join()
+            with open(path, "w") as f:
+                for stack, count in self._samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._samples = None
+        log_event("profile_written", path=path)
+        return path
+
+    def toggle(self, seconds=PROFILE_SECONDS):
+        if self.running:
+            return self.stop()
+        return self.start(seconds)
+
+    def _sample(self, thread_id):
+        period = 1 / self.sample_hz
+        while not self._stop_sampling.wait(period):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self._samples[";".join(reversed(names))] += 1
+
+PROFILER = Profiler()
+
+###############################################################################
+# Session recording (opt-in transcripts of client input, for replay)
+###############################################################################
+
+RECORD = logging.getLogger("bbs.record")
+
+# The current session's Transcript while the recorder runs, else None.
+TRANSCRIPT = contextvars.ContextVar("bbs_transcript", default=None)
+
+class Transcript:
+    """
+    One session's input lines as [ms since the previous line, text] pairs,
+    the first counted from connect. Secret lines (passwords) are stored as
+    None; the replayer substitutes its own.
+    """
+
+    __slots__ = ("at", "last", "lines")
+
+    def __init__(self, at):
+        self.at = at  # ms from the start of the recording to connect
+        self.last = time.monotonic()
+        self.lines = []
+
+    def add(self, line, secret=False):
+        now = time.monotonic()
+        self.lines.append([round((now - self.last) * 1000), None if secret else line])
+        self.last = now
+
+class SessionRecorder:
+    """
+    Writes each finished session's Transcript as one JSON line to a file in
+    directory, through a background listener. The first line is a header.
+    Sessions already connected when recording starts are not recorded.
+    """
+
+    FORMAT = "bbs-transcript"
+    VERSION = 1
+
+    def __init__(self, directory=RECORD_DIR):
+        self.directory = directory
+        self.path = None
+        self.started = None
+        self._listener = None
+
+    @property
+    def running(self):
+        return self.path is not None
+
+    def start(self):
+        """Open a new transcript file. Returns its path."""
+        if self.running:
+            return self.path
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(self.directory, f"sessions-{stamp}-{os.getpid()}.jsonl")
+        output = logging.FileHandler(self.path, encoding="utf-8")
+        output.setFormatter(JsonMessageFormatter())
+        record_queue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(record_queue, output)
+
+        for handler in list(RECORD.handlers):
+            RECORD.removeHandler(handler)
+        RECORD.addHandler(_SessionQueueHandler(record_queue))
+        RECORD.setLevel(logging.INFO)
+        RECORD.propagate = False
+        self._listener.start()
+        self.started = time.monotonic()
+        RECORD.info({"format": self.FORMAT, "version": self.VERSION,
+                     "started": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")})
+        log_event("recording_started", path=self.path)
+        return self.path
+
+    def stop(self):
+        """Flush and close the file. Returns the path written, or None."""
+        if not self.running:
+            return None
+        path, self.path = self.path, None
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+        for handler in list(RECORD.handlers):
+            RECORD.removeHandler(handler)
+        log_event("recording_written", path=path)
+        return path
+
+    def transcript(self):
+        """A new Transcript for a connecting session, or None if not recording."""
+        if not self.running:
+            return None
+        return Transcript(round((time.monotonic() - self.started) * 1000))
+
+    def save(self, transcript):
+        if self.running and transcript.lines:
+            RECORD.info({"at": transcript.at, "lines": transcript.lines})
+
+RECORDER = SessionRecorder()
+
 ###############################################################################
 # Global in-memory session tracking (for /who)
 ###############################################################################
 
-ACTIVE_USERS = set()
-ACTIVE_LOCK = asyncio.Lock()
+class _SkipNode:
+    __slots__ = ("value", "next", "width")
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+class PresenceIndex:
+    """
+    Sorted set of online usernames backed by an indexable skip list.
+
+    add/discard/rank/lookup-by-position are O(log n) and a page slice costs
+    O(log n + page size), so /who never has to walk the whole online list.
+    """
+
+    MAX_LEVELS = 24
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._head = _SkipNode(None, self.MAX_LEVELS)
+        self._members = set()
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, value):
+        return value in self._members
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not None:
+            yield node.value
+            node = node.next[0]
+
+    def _random_levels(self):
+        levels = 1
+        while levels < self.MAX_LEVELS and random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def add(self, value):
+        if value in self._members:
+            return
+        chain = [None] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = self._random_levels()
+        new = _SkipNode(value, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._members.add(value)
+
+    def discard(self, value):
+        if value not in self._members:
+            return
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        levels = len(target.next)
+        for level in range(levels):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._members.discard(value)
+
+    remove = discard
+
+    def rank(self, value):
+        """Number of members strictly less than value."""
+        steps = 0
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].value < value:
+                steps += node.width[level]
+                node = node.next[level]
+        return steps
+
+    def slice(self, start, stop):
+        """Members at sorted positions [start, stop)."""
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        out = []
+        while node is not None and len(out) < stop - start:
+            out.append(node.value)
+            node = node.next[0]
+        return out
+
+    def prefix_range(self, prefix):
+        """Sorted positions [lo, hi) of members starting with prefix."""
+        if not prefix:
+            return 0, len(self)
+        return self.rank(prefix), self.rank(prefix + "\U0010ffff")
+
+ACTIVE_USERS = PresenceIndex()
+ACTIVE_LOCK = asyncio.Lock()
+
+async def add_active_user(username):
+    async with ACTIVE_LOCK:
+        ACTIVE_USERS.add(username)
+
+async def remove_active_user(username):
+    async with ACTIVE_LOCK:
+        ACTIVE_USERS.discard(username)
+
+async def list_active_users():
+    async with ACTIVE_LOCK:
+        return list(ACTIVE_USERS)
+
+async def who_page(prefix="", page=0, page_size=WHO_PAGE_SIZE):
+    """
+    One page of the sorted presence index, optionally filtered by prefix.
+    Returns (online_total, matched, page, names); page is clamped to range.
+    """
+    async with ACTIVE_LOCK:
+        lo, hi = ACTIVE_USERS.prefix_range(prefix)
+        matched = hi - lo
+        last_page = max((matched - 1) // page_size, 0)
+        page = min(max(page, 0), last_page)
+        start = lo + page * page_size
+        names = ACTIVE_USERS.slice(start, min(start + page_size, hi))
+        return len(ACTIVE_USERS), matched, page, names
+
+###############################################################################
+# In-process pub/sub (live push of new posts)
+###############################################################################
+
+class Subscription:
+    """
+    Bounded per-session queue of board events.
+
+    When the reader falls behind, "drop-oldest" discards the oldest pending
+    event and "coalesce" folds everything pending into a single summary,
+    so a slow session never makes a publisher wait or grow memory.
+    """
+
+    def __init__(self, username, maxsize=PUSH_QUEUE_SIZE, policy=PUSH_POLICY,
+                 board_id=DEFAULT_BOARD_ID):
+        self.username = username
+        self.board_id = board_id
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+            return
+        if self.policy == "coalesce":
+            count = merged = 1
+            while not self.queue.empty():
+                pending = self.queue.get_nowait()
+                count += pending.get("coalesced", 1)
+                # Events in an earlier summary were counted when it was made.
+                merged += "coalesced" not in pending
+            self.queue.put_nowait({"coalesced": count})
+            self.dropped += merged
+        else:
+            self.queue.get_nowait()
+            self.queue.put_nowait(event)
+            self.dropped += 1
+
+    async def get(self):
+        return await self.queue.get()
+
+    def set_board(self, board_id):
+        """Follow another board, forgetting events queued for the old one."""
+        self.board_id = board_id
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+class MessageHub:
+    def __init__(self):
+        self._subscribers = set()
+        self._dropped_closed = 0  # drops counted by subscriptions since closed
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    @property
+    def dropped(self):
+        return self._dropped_closed + sum(sub.dropped for sub in self._subscribers)
+
+    def subscribe(self, username, **kwargs):
+        sub = Subscription(username, **kwargs)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        if sub in self._subscribers:
+            self._subscribers.discard(sub)
+            self._dropped_closed += sub.dropped
+
+    def publish(self, event):
+        """
+        Fan an event out to every subscriber reading the event's board,
+        except its author. Never blocks.
+        """
+        author = event.get("author")
+        board_id = event.get("board_id", DEFAULT_BOARD_ID)
+        for sub in self._subscribers:
+            if sub.username != author and sub.board_id == board_id:
+                sub.offer(event)
+
+HUB = MessageHub()
+
+###############################################################################
+# Posting flood control
+###############################################################################
+
+class PostGuard:
+    """
+    Per-user sliding-window post limit plus a short-lived set of recent body
+    digests, checked in memory before anything reaches the database.
+    """
+
+    DIGESTS_PER_USER = 32
+    SWEEP_EVERY = 1000
+
+    def __init__(self, max_posts=POST_RATE_LIMIT, window=POST_RATE_WINDOW,
+                 duplicate_window=DUPLICATE_WINDOW):
+        self.max_posts = max_posts
+        self.window = window
+        self.duplicate_window = duplicate_window
+        self._posts = {}    # username -> deque of post times
+        self._digests = {}  # username -> OrderedDict digest -> expiry
+        self._checks = 0
+        self.accepted = 0
+        self.rate_limited = 0
+        self.duplicates = 0
+
+    @staticmethod
+    def digest(body):
+        return hashlib.blake2b(body.strip().encode("utf-8"), digest_size=16).digest()
+
+    def _expire(self, username, now):
+        times = self._posts.get(username)
+        if times is not None:
+            while times and times[0] <= now - self.window:
+                times.popleft()
+            if not times:
+                del self._posts[username]
+        digests = self._digests.get(username)
+        if digests is not None:
+            while digests and next(iter(digests.values())) <= now:
+                digests.popitem(last=False)
+            if not digests:
+                del self._digests[username]
+
+    def retry_after(self, username, now=None):
+        """Seconds until username may post again (0 if allowed now)."""
+        now = time.monotonic() if now is None else now
+        self._expire(username, now)
+        times = self._posts.get(username)
+        if times is None or len(times) < self.max_posts:
+            return 0
+        return times[0] + self.window - now
+
+    def check(self, username, body, now=None):
+        """
+        Record and allow a post, or refuse it. Returns None when allowed,
+        otherwise "rate" or "duplicate".
+        """
+        now = time.monotonic() if now is None else now
+        self._checks += 1
+        if self._checks % self.SWEEP_EVERY == 0:
+            self.sweep(now)
+
+        if self.retry_after(username, now) > 0:
+            self.rate_limited += 1
+            return "rate"
+        digest = self.digest(body)
+        digests = self._digests.setdefault(username, collections.OrderedDict())
+        if digest in digests:
+            self.duplicates += 1
+            return "duplicate"
+
+        digests[digest] = now + self.duplicate_window
+        while len(digests) > self.DIGESTS_PER_USER:
+            digests.popitem(last=False)
+        self._posts.setdefault(username, collections.deque()).append(now)
+        self.accepted += 1
+        return None
+
+    def sweep(self, now=None):
+        """Drop state for users whose windows have fully expired."""
+        now = time.monotonic() if now is None else now
+        for username in set(self._posts) | set(self._digests):
+            self._expire(username, now)
+
+    def stats(self):
+        return {
+            "accepted": self.accepted,
+            "rate_limited": self.rate_limited,
+            "duplicates": self.duplicates,
+            "tracked_users": len(set(self._posts) | set(self._digests)),
+        }
+
+POST_GUARD = PostGuard()
+
+@METRICS.collector
+def server_metrics():
+    yield "bbs_active_users", "gauge", {}, len(ACTIVE_USERS)
+    yield "bbs_push_subscribers", "gauge", {}, len(HUB)
+    yield "bbs_push_dropped_total", "counter", {}, HUB.dropped
+    stats = POST_GUARD.stats()
+    for result in ("accepted", "rate_limited", "duplicates"):
+        yield "bbs_post_guard_total", "counter", {"result": result}, stats[result]
+
+###############################################################################
+# Schema migrations (versioned with PRAGMA user_version)
+###############################################################################
+
+# External-content FTS5 index over messages, kept in sync by triggers so
+# post_message needs no extra work.
+FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        body, author, content='messages', content_rowid='id'
+    );
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, body, author) VALUES (new.id, new.body, new.author);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body, author)
+        VALUES ('delete', old.id, old.body, old.author);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body, author)
+        VALUES ('delete', old.id, old.body, old.author);
+        INSERT INTO messages_fts(rowid, body, author) VALUES (new.id, new.body, new.author);
+    END;
+    """,
+]
+
+# Update trigger from migration 5 on: only re-index when indexed columns
+# change, not on thread bookkeeping updates.
+FTS_UPDATE_TRIGGER_V5 = """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF body, author ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body, author)
+        VALUES ('delete', old.id, old.body, old.author);
+        INSERT INTO messages_fts(rowid, body, author) VALUES (new.id, new.body, new.author);
+    END;
+"""
+
+# Current FTS triggers. Compressed rows keep an empty body column, so the
+# triggers skip them: post_message indexes their plain text itself and
+# delete_message removes it. Compressing an existing row (compressed 0 -> 1)
+# leaves its index entry untouched.
+FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages
+    WHEN new.compressed = 0 BEGIN
+        INSERT INTO messages_fts(rowid, body, author) VALUES (new.id, new.body, new.author);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages
+    WHEN old.compressed = 0 BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body, author)
+        VALUES ('delete', old.id, old.body, old.author);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF body, author ON messages
+    WHEN old.compressed = 0 AND new.compressed = 0 BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body, author)
+        VALUES ('delete', old.id, old.body, old.author);
+        INSERT INTO messages_fts(rowid, body, author) VALUES (new.id, new.body, new.author);
+    END;
+    """,
+]
+
+# Selects a message body as stored: TEXT, or zlib BLOB when compressed.
+# message_text() turns either into a str.
+BODY_SQL = "CASE WHEN compressed THEN body_z ELSE body END"
+
+# SQL expression converting an ISO-8601 text column to epoch milliseconds,
+# leaving values that are already integers alone.
+ISO_TO_EPOCH_MS = """
+    CASE WHEN typeof({col}) = 'integer' THEN {col}
+    ELSE COALESCE(CAST(ROUND((julianday({col}) - 2440587.5) * 86400000) AS INTEGER), 0)
+    END
+"""
+
+# (version, description, statements). Append only; never edit a shipped
+# migration. Every statement must be safe to run against a database that
+# predates versioning (hence IF NOT EXISTS everywhere).
+MIGRATIONS = [
+    (1, "Base tables, read marks and full-text index", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password_hash BLOB NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            author TEXT NOT NULL,
+            body TEXT NOT NULL,
+            posted_at TEXT NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS read_marks (
+            username TEXT PRIMARY KEY,
+            last_read_id INTEGER NOT NULL
+        );
+        """,
+        *FTS_SCHEMA,
+        # Index whatever was posted before search existed.
+        "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild');",
+    ]),
+    (2, "Index messages by author and by posted_at", [
+        "CREATE INDEX IF NOT EXISTS idx_messages_author ON messages (author, id);",
+        "CREATE INDEX IF NOT EXISTS idx_messages_posted_at ON messages (posted_at);",
+    ]),
+    (3, "Store timestamps as integer epoch milliseconds", [
+        # SQLite can't change a column's type in place, so rebuild both
+        # tables, converting any ISO-8601 text as rows are copied.
+        """
+        CREATE TABLE users_new (
+            username TEXT PRIMARY KEY,
+            password_hash BLOB NOT NULL,
+            created_at INTEGER NOT NULL
+        );
+        """,
+        f"""
+        INSERT INTO users_new (username, password_hash, created_at)
+        SELECT username, password_hash, {ISO_TO_EPOCH_MS.format(col="created_at")} FROM users;
+        """,
+        "DROP TABLE users;",
+        "ALTER TABLE users_new RENAME TO users;",
+        """
+        CREATE TABLE messages_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            author TEXT NOT NULL,
+            body TEXT NOT NULL,
+            posted_at INTEGER NOT NULL
+        );
+        """,
+        f"""
+        INSERT INTO messages_new (id, author, body, posted_at)
+        SELECT id, author, body, {ISO_TO_EPOCH_MS.format(col="posted_at")} FROM messages;
+        """,
+        # Dropping messages also drops its triggers and indexes; the FTS
+        # table keys on the preserved ids so it stays valid.
+        "DROP TABLE messages;",
+        "ALTER TABLE messages_new RENAME TO messages;",
+        *FTS_SCHEMA[1:],
+        "CREATE INDEX IF NOT EXISTS idx_messages_author ON messages (author, id);",
+        "CREATE INDEX IF NOT EXISTS idx_messages_posted_at ON messages (posted_at);",
+    ]),
+    (4, "Named boards with per-board message index and read marks", [
+        """
+        CREATE TABLE IF NOT EXISTS boards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            description TEXT NOT NULL DEFAULT '',
+            created_at INTEGER NOT NULL
+        );
+        """,
+        """
+        INSERT OR IGNORE INTO boards (id, name, description, created_at)
+        VALUES (1, 'general', 'General discussion',
+                CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+        """,
+        "ALTER TABLE messages ADD COLUMN board_id INTEGER NOT NULL DEFAULT 1;",
+        "CREATE INDEX IF NOT EXISTS idx_messages_board ON messages (board_id, id);",
+        """
+        CREATE TABLE read_marks_new (
+            username TEXT NOT NULL,
+            board_id INTEGER NOT NULL,
+            last_read_id INTEGER NOT NULL,
+            PRIMARY KEY (username, board_id)
+        ) WITHOUT ROWID;
+        """,
+        """
+        INSERT INTO read_marks_new (username, board_id, last_read_id)
+        SELECT username, 1, last_read_id FROM read_marks;
+        """,
+        "DROP TABLE read_marks;",
+        "ALTER TABLE read_marks_new RENAME TO read_marks;",
+    ]),
+    (5, "Threaded replies with materialized paths and reply counts", [
+        "DROP TRIGGER IF EXISTS messages_fts_au;",
+        FTS_UPDATE_TRIGGER_V5,
+        "ALTER TABLE messages ADD COLUMN parent_id INTEGER;",
+        "ALTER TABLE messages ADD COLUMN thread_id INTEGER;",
+        "ALTER TABLE messages ADD COLUMN path TEXT;",
+        "ALTER TABLE messages ADD COLUMN reply_count INTEGER NOT NULL DEFAULT 0;",
+        "UPDATE messages SET thread_id = id, path = printf('%010d', id);",
+        "CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages (thread_id, path);",
+        # A new message inherits its parent's thread and extends its path
+        # ("root/child/..." of zero-padded ids, so sorting by path yields
+        # depth-first order); the root's reply_count is bumped in place.
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_thread_ai AFTER INSERT ON messages BEGIN
+            UPDATE messages SET
+                thread_id = COALESCE(
+                    (SELECT thread_id FROM messages WHERE id = new.parent_id), new.id),
+                path = COALESCE(
+                    (SELECT path FROM messages WHERE id = new.parent_id) || '/', '')
+                    || printf('%010d', new.id)
+            WHERE id = new.id;
+            UPDATE messages SET reply_count = reply_count + 1
+            WHERE new.parent_id IS NOT NULL
+              AND id = (SELECT thread_id FROM messages WHERE id = new.parent_id);
+        END;
+        """,
+    ]),
+    (6, "Private mailbox with per-recipient index and unread counters", [
+        """
+        CREATE TABLE IF NOT EXISTS private_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            body TEXT NOT NULL,
+            sent_at INTEGER NOT NULL,
+            read_at INTEGER
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_private_recipient ON private_messages (recipient, id);",
+        """
+        CREATE TABLE IF NOT EXISTS mailbox_stats (
+            username TEXT PRIMARY KEY,
+            unread INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+        """,
+    ]),
+    (7, "Optional zlib compression of large message bodies", [
+        "ALTER TABLE messages ADD COLUMN body_z BLOB;",
+        "ALTER TABLE messages ADD COLUMN compressed INTEGER NOT NULL DEFAULT 0;",
+        "DROP TRIGGER IF EXISTS messages_fts_ai;",
+        "DROP TRIGGER IF EXISTS messages_fts_ad;",
+        "DROP TRIGGER IF EXISTS messages_fts_au;",
+        *FTS_TRIGGERS,
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+MIGRATION_BUSY_TIMEOUT_MS = 30000
+
+def get_schema_version(db_path=None):
+    conn = sqlite3.connect(db_path or DB_PATH)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version
+
+def run_migrations(db_path=None, dry_run=False):
+    """
+    Bring the database up to SCHEMA_VERSION and return the migrations that
+    were (or, with dry_run, would be) applied as (version, description,
+    statements).
+
+    Each migration runs in its own BEGIN IMMEDIATE transaction together with
+    its user_version bump, so a crash never leaves a half-applied step. The
+    database is switched to WAL first so readers keep working while an index
+    builds, and a generous busy timeout makes live writers wait rather than
+    fail while a migration holds the write lock.
+    """
+    conn = sqlite3.connect(db_path or DB_PATH, isolation_level=None)
+    c = conn.cursor()
+    current = c.execute("PRAGMA user_version").fetchone()[0]
+    pending = [m for m in MIGRATIONS if m[0] > current]
+    if dry_run or not pending:
+        conn.close()
+        return pending
+
+    c.execute(f"PRAGMA busy_timeout = {MIGRATION_BUSY_TIMEOUT_MS}")
+    c.execute("PRAGMA journal_mode = WAL")
+    for version, _, statements in pending:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                c.execute(statement)
+            c.execute(f"PRAGMA user_version = {version}")
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            conn.close()
+            raise
+    conn.close()
+    return pending
+
+###############################################################################
+# Persistent storage layer (SQLite)
+###############################################################################
+
+def init_db():
+    run_migrations()
+
+def rebuild_search_index():
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    for statement in [FTS_SCHEMA[0], *FTS_TRIGGERS]:
+        c.execute(statement)
+    c.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    # 'rebuild' indexed compressed rows from their empty body column;
+    # swap those entries for the real text.
+    c.execute("SELECT id, author, body_z FROM messages WHERE compressed = 1")
+    for message_id, author, body_z in c.fetchall():
+        c.execute(
+            "INSERT INTO messages_fts(messages_fts, rowid, body, author) VALUES ('delete', ?, '', ?)",
+            (message_id, author)
+        )
+        c.execute(
+            "INSERT INTO messages_fts(rowid, body, author) VALUES (?, ?, ?)",
+            (message_id, message_text(body_z), author)
+        )
+    conn.commit()
+    conn.close()
+
+def pack_body(body):
+    """
+    Column values (body, body_z, compressed) for storing body. Bodies of at
+    least COMPRESS_MIN_BYTES are zlib-compressed when that actually saves
+    space.
+    """
+    raw = body.encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(raw, COMPRESS_LEVEL)
+        if len(packed) < len(raw):
+            return "", packed, 1
+    return body, None, 0
+
+def message_text(body):
+    """Plain text of a body selected with BODY_SQL."""
+    if isinstance(body, bytes):
+        return zlib.decompress(body).decode("utf-8")
+    return body
+
+def compress_existing_messages(min_bytes=None, batch_size=500):
+    """
+    Compress stored bodies of at least min_bytes in id-ordered batches.
+    Returns (rows_compressed, bytes_before, bytes_after).
+    """
+    min_bytes = COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+    rows_done = bytes_before = bytes_after = 0
+    last_id = 0
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    while True:
+        c.execute(
+            "SELECT id, body FROM messages WHERE compressed = 0 AND id > ? "
+            "AND length(CAST(body AS BLOB)) >= ? ORDER BY id LIMIT ?",
+            (last_id, min_bytes, batch_size)
+        )
+        batch = c.fetchall()
+        if not batch:
+            break
+        updates = []
+        for message_id, body in batch:
+            raw = body.encode("utf-8")
+            packed = zlib.compress(raw, COMPRESS_LEVEL)
+            if len(packed) < len(raw):
+                updates.append((packed, message_id))
+                bytes_before += len(raw)
+                bytes_after += len(packed)
+        c.executemany(
+            "UPDATE messages SET body = '', body_z = ?, compressed = 1 WHERE id = ?",
+            updates
+        )
+        conn.commit()
+        rows_done += len(updates)
+        last_id = batch[-1][0]
+    conn.close()
+    return rows_done, bytes_before, bytes_after
+
+def now_ms():
+    """Current time as integer epoch milliseconds (how timestamps are stored)."""
+    return time.time_ns() // 1_000_000
+
+@timed("bbs_storage_seconds")
+def get_user(username):
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT username, password_hash FROM users WHERE username = ?", (username,))
+    row = c.fetchone()
+    conn.close()
+    return row  # (username, password_hash) or None
+
+@timed("bbs_storage_seconds")
+def create_user(username, password_plain):
+    with METRICS.time("bbs_bcrypt_seconds", op="hash"), trace_span("bcrypt.hashpw", "crypto"):
+        password_hash = bcrypt.hashpw(password_plain.encode("utf-8"), bcrypt.gensalt())
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
+        (username, password_hash, now_ms())
+    )
+    conn.commit()
+    conn.close()
+
+@timed("bbs_storage_seconds")
+def list_messages(limit=10, board_id=DEFAULT_BOARD_ID):
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        f"SELECT author, {BODY_SQL}, posted_at FROM messages WHERE board_id = ? "
+        "ORDER BY id DESC LIMIT ?",
+        (board_id, limit)
+    )
+    rows = [(author, message_text(body), ts) for author, body, ts in c.fetchall()]
+    conn.close()
+    return rows
+
+@timed("bbs_storage_seconds")
+def list_messages_before(before_id=None, limit=10, board_id=DEFAULT_BOARD_ID):
+    """
+    Keyset page of messages older than before_id (or the newest page when
+    None), newest first. Seeks on the (board_id, id) index, so any page
+    costs the same. Rows are (id, author, body, posted_at).
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if before_id is None:
+        c.execute(
+            f"SELECT id, author, {BODY_SQL}, posted_at FROM messages WHERE board_id = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (board_id, limit)
+        )
+    else:
+        c.execute(
+            f"SELECT id, author, {BODY_SQL}, posted_at FROM messages WHERE board_id = ? AND id < ? "
+            "ORDER BY id DESC LIMIT ?",
+            (board_id, before_id, limit)
+        )
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+@timed("bbs_storage_seconds")
+def list_messages_since(after_id, limit=10, board_id=DEFAULT_BOARD_ID):
+    """Messages with id > after_id, oldest first. Rows are (id, author, body, posted_at)."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        f"SELECT id, author, {BODY_SQL}, posted_at FROM messages WHERE board_id = ? AND id > ? "
+        "ORDER BY id ASC LIMIT ?",
+        (board_id, after_id, limit)
+    )
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def list_messages_after(after_id, limit=10, board_id=DEFAULT_BOARD_ID):
+    """Keyset page of the messages immediately newer than after_id, newest first."""
+    rows = list_messages_since(after_id, limit, board_id)
+    rows.reverse()
+    return rows
+
+@timed("bbs_storage_seconds")
+def post_message(author, body, board_id=DEFAULT_BOARD_ID, parent_id=None):
+    """
+    Store a post (a reply when parent_id is given; it should be on the
+    parent's board). Thread id, path and reply count are filled in by the
+    messages_thread_ai trigger in the same statement.
+    """
+    posted_at = now_ms()
+    stored_body, body_z, compressed = pack_body(body)
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO messages (board_id, parent_id, author, body, body_z, compressed, posted_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (board_id, parent_id, author, stored_body, body_z, compressed, posted_at)
+    )
+    message_id = c.lastrowid
+    if compressed:
+        # The FTS insert trigger skips compressed rows; index the plain text.
+        c.execute(
+            "INSERT INTO messages_fts(rowid, body, author) VALUES (?, ?, ?)",
+            (message_id, body, author)
+        )
+    conn.commit()
+    conn.close()
+    remember_latest(board_id, (message_id, author, body, posted_at))
+    HUB.publish({
+        "id": message_id, "board_id": board_id, "parent_id": parent_id,
+        "author": author, "body": body, "posted_at": posted_at,
+    })
+    return message_id
+
+@timed("bbs_storage_seconds")
+def get_message(message_id):
+    """(id, board_id, thread_id, author, body, posted_at) or None."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        f"SELECT id, board_id, thread_id, author, {BODY_SQL}, posted_at FROM messages WHERE id = ?",
+        (message_id,)
+    )
+    row = c.fetchone()
+    conn.close()
+    return row
+
+@timed("bbs_storage_seconds")
+def delete_message(message_id):
+    """
+    Remove a message and its search index entry. Returns False if there was
+    no such message. Replies stay in their thread; the root's reply count
+    drops by one.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        "SELECT author, body_z, compressed, thread_id FROM messages WHERE id = ?",
+        (message_id,)
+    )
+    row = c.fetchone()
+    if row is None:
+        conn.close()
+        return False
+    author, body_z, compressed, thread_id = row
+    if compressed:
+        # The delete trigger can't see the plain text of a compressed row,
+        # and an external-content 'delete' must repeat what was indexed.
+        c.execute(
+            "INSERT INTO messages_fts(messages_fts, rowid, body, author) VALUES ('delete', ?, ?, ?)",
+            (message_id, message_text(body_z), author)
+        )
+    c.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+    c.execute(
+        "UPDATE messages SET reply_count = reply_count - 1 WHERE id = ? AND id != ?",
+        (thread_id, message_id)
+    )
+    conn.commit()
+    conn.close()
+    # Rendered lines are keyed by id (and width); deletes are rare enough
+    # to simply start the caches over. Only this process's caches: a server
+    # running elsewhere needs the admin console's flush.
+    clear_caches()
+    return True
+
+@timed("bbs_storage_seconds")
+def get_thread(thread_id):
+    """
+    Every message of a thread in depth-first order with a single range scan
+    of idx_messages_thread. Rows are (id, author, body, posted_at, depth,
+    reply_count); reply_count is only meaningful on the root.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        f"""
+        SELECT id, author, {BODY_SQL}, posted_at,
+               length(path) / 11 AS depth, reply_count
+        FROM messages WHERE thread_id = ? ORDER BY path
+        """,
+        (thread_id,)
+    )
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def fts_query(text):
+    """Quote each word so user input can't trip FTS5 query syntax."""
+    terms = ['"' + t.replace('"', '""') + '"' for t in text.split()]
+    return " ".join(terms)
+
+@timed("bbs_storage_seconds")
+def search_messages(text, limit=10, offset=0):
+    """
+    Best-ranked (bm25) messages matching every word in text, across all
+    boards. Rows are (id, author, body, posted_at).
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        """
+        SELECT m.id, m.author, CASE WHEN m.compressed THEN m.body_z ELSE m.body END, m.posted_at
+        FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+        WHERE messages_fts MATCH ?
+        ORDER BY messages_fts.rank
+        LIMIT ? OFFSET ?
+        """,
+        (query, limit, offset)
+    )
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+###############################################################################
+# Boards
+###############################################################################
+
+@timed("bbs_storage_seconds")
+def list_boards():
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT id, name, description FROM boards ORDER BY id")
+    rows = c.fetchall()
+    conn.close()
+    return rows
 
-async def add_active_user(username):
-    async with ACTIVE_LOCK:
-        ACTIVE_USERS.add(username)
+@timed("bbs_storage_seconds")
+def get_board(key):
+    """Look a board up by id or by name. Returns (id, name, description) or None."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if isinstance(key, int) or str(key).isdigit():
+        c.execute("SELECT id, name, description FROM boards WHERE id = ?", (int(key),))
+    else:
+        c.execute("SELECT id, name, description FROM boards WHERE name = ?", (key,))
+    row = c.fetchone()
+    conn.close()
+    return row
 
-async def remove_active_user(username):
-    async with ACTIVE_LOCK:
-        if username in ACTIVE_USERS:
-            ACTIVE_USERS.remove(username)
+@timed("bbs_storage_seconds")
+def create_board(name, description=""):
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO boards (name, description, created_at) VALUES (?, ?, ?)",
+        (name, description, now_ms())
+    )
+    board_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return board_id
 
-async def list_active_users():
-    async with ACTIVE_LOCK:
-        return list(ACTIVE_USERS)
+# board_id -> newest BOARD_LATEST_ROWS rows of that board, newest first.
+# One entry per board, so a busy board never evicts a quiet one's feed.
+BOARD_LATEST_CACHE = {}
+
+def latest_messages(board_id=DEFAULT_BOARD_ID, limit=10):
+    """
+    The newest messages on a board, served from the per-board cache. Not
+    timed itself: only the list_messages_before query behind a miss is.
+    """
+    if limit > BOARD_LATEST_ROWS:
+        return list_messages_before(None, limit, board_id)
+    rows = BOARD_LATEST_CACHE.get(board_id)
+    if rows is None:
+        METRICS.inc("bbs_cache_lookups_total", cache="board_latest", result="miss")
+        rows = list_messages_before(None, BOARD_LATEST_ROWS, board_id)
+        BOARD_LATEST_CACHE[board_id] = rows
+    else:
+        METRICS.inc("bbs_cache_lookups_total", cache="board_latest", result="hit")
+    return rows[:limit]
+
+def remember_latest(board_id, row):
+    rows = BOARD_LATEST_CACHE.get(board_id)
+    if rows is not None:
+        rows.insert(0, row)
+        del rows[BOARD_LATEST_ROWS:]
 
 ###############################################################################
-# Persistent storage layer (SQLite)
+# Private mailbox
 ###############################################################################
 
-def init_db():
+@timed("bbs_storage_seconds")
+def send_private_message(sender, recipient, body):
+    """Store a private message and bump the recipient's counters atomically."""
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        username TEXT PRIMARY KEY,
-        password_hash BLOB NOT NULL,
-        created_at TEXT NOT NULL
-    );
-    """)
-
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS messages (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        author TEXT NOT NULL,
-        body TEXT NOT NULL,
-        posted_at TEXT NOT NULL
-    );
-    """)
-
+    c.execute(
+        "INSERT INTO private_messages (sender, recipient, body, sent_at) VALUES (?, ?, ?, ?)",
+        (sender, recipient, body, now_ms())
+    )
+    message_id = c.lastrowid
+    c.execute(
+        """
+        INSERT INTO mailbox_stats (username, unread, total) VALUES (?, 1, 1)
+        ON CONFLICT(username) DO UPDATE SET unread = unread + 1, total = total + 1
+        """,
+        (recipient,)
+    )
     conn.commit()
     conn.close()
+    return message_id
 
-def get_user(username):
+@timed("bbs_storage_seconds")
+def get_mailbox_counts(username):
+    """(unread, total) from the counter row; never scans the mailbox."""
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT username, password_hash FROM users WHERE username = ?", (username,))
+    c.execute("SELECT unread, total FROM mailbox_stats WHERE username = ?", (username,))
     row = c.fetchone()
     conn.close()
-    return row  # (username, password_hash) or None
+    return row if row else (0, 0)
 
-def create_user(username, password_plain):
-    password_hash = bcrypt.hashpw(password_plain.encode("utf-8"), bcrypt.gensalt())
+@timed("bbs_storage_seconds")
+def list_mailbox(username, before_id=None, limit=10):
+    """
+    Keyset page of a user's inbox, newest first, via (recipient, id).
+    Rows are (id, sender, body, sent_at, read_at).
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if before_id is None:
+        c.execute(
+            "SELECT id, sender, body, sent_at, read_at FROM private_messages "
+            "WHERE recipient = ? ORDER BY id DESC LIMIT ?",
+            (username, limit)
+        )
+    else:
+        c.execute(
+            "SELECT id, sender, body, sent_at, read_at FROM private_messages "
+            "WHERE recipient = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (username, before_id, limit)
+        )
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+@timed("bbs_storage_seconds")
+def mark_mailbox_read(username, message_ids):
+    """Mark shown messages read and decrement the unread counter to match."""
+    if not message_ids:
+        return 0
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
+    placeholders = ", ".join("?" * len(message_ids))
     c.execute(
-        "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
-        (username, password_hash, datetime.datetime.utcnow().isoformat())
+        f"UPDATE private_messages SET read_at = ? "
+        f"WHERE recipient = ? AND read_at IS NULL AND id IN ({placeholders})",
+        (now_ms(), username, *message_ids)
     )
+    changed = c.rowcount
+    if changed:
+        c.execute(
+            "UPDATE mailbox_stats SET unread = MAX(unread - ?, 0) WHERE username = ?",
+            (changed, username)
+        )
     conn.commit()
     conn.close()
+    return changed
+
+###############################################################################
+# Read marks (per-user, per-board unread high-water mark, written in batches)
+###############################################################################
+
+# (username, board_id) -> last_read_id not yet written to read_marks
+PENDING_READ_MARKS = {}
 
-def list_messages(limit=10):
+def get_last_read_id(username, board_id=DEFAULT_BOARD_ID):
+    pending = PENDING_READ_MARKS.get((username, board_id))
+    if pending is not None:
+        METRICS.inc("bbs_cache_lookups_total", cache="read_marks", result="hit")
+        return pending
+    METRICS.inc("bbs_cache_lookups_total", cache="read_marks", result="miss")
+    return load_last_read_id(username, board_id)
+
+@timed("bbs_storage_seconds")
+def load_last_read_id(username, board_id=DEFAULT_BOARD_ID):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT author, body, posted_at FROM messages ORDER BY id DESC LIMIT ?", (limit,))
-    rows = c.fetchall()
+    c.execute(
+        "SELECT last_read_id FROM read_marks WHERE username = ? AND board_id = ?",
+        (username, board_id)
+    )
+    row = c.fetchone()
     conn.close()
-    return rows
+    return row[0] if row else 0
 
-def post_message(author, body):
+def mark_read(username, message_id, board_id=DEFAULT_BOARD_ID):
+    """
+    Advance a user's high-water mark in memory. Marks only move forward and
+    are written out once READ_MARK_BATCH marks are pending (or by the
+    periodic flusher), so reading never costs a write per page.
+    """
+    key = (username, board_id)
+    if message_id <= PENDING_READ_MARKS.get(key, 0):
+        return
+    PENDING_READ_MARKS[key] = message_id
+    if len(PENDING_READ_MARKS) >= READ_MARK_BATCH:
+        flush_read_marks()
+
+def flush_read_marks():
+    if not PENDING_READ_MARKS:
+        return 0
+    batch = [(user, board, last) for (user, board), last in PENDING_READ_MARKS.items()]
+    PENDING_READ_MARKS.clear()
+    return write_read_marks(batch)
+
+@timed("bbs_storage_seconds")
+def write_read_marks(batch):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute(
-        "INSERT INTO messages (author, body, posted_at) VALUES (?, ?, ?)",
-        (author, body, datetime.datetime.utcnow().isoformat())
+    c.executemany(
+        """
+        INSERT INTO read_marks (username, board_id, last_read_id) VALUES (?, ?, ?)
+        ON CONFLICT(username, board_id) DO UPDATE
+        SET last_read_id = MAX(last_read_id, excluded.last_read_id)
+        """,
+        batch
     )
     conn.commit()
     conn.close()
+    return len(batch)
+
+async def read_mark_flusher():
+    while True:
+        await asyncio.sleep(READ_MARK_FLUSH_SECS)
+        flush_read_marks()
+
+###############################################################################
+# Read-path caches and rendering
+###############################################################################
+
+class LRUCache:
+    """Small least-recently-used cache with hit/miss counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+# message id -> rendered "[time] author: body" line
+MESSAGE_LINE_CACHE = LRUCache(MESSAGE_CACHE_SIZE)
+
+# (message id, terminal width) -> rendered line word-wrapped to that width
+WRAP_CACHE = LRUCache(WRAP_CACHE_SIZE)
+
+MIN_WRAP_WIDTH = 20
+
+def clear_caches():
+    MESSAGE_LINE_CACHE.clear()
+    BOARD_LATEST_CACHE.clear()
+    WRAP_CACHE.clear()
+    SCREEN_CACHE.clear()
+
+def format_timestamp(ms):
+    """Render stored epoch milliseconds as UTC wall-clock time."""
+    dt = datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+def render_message(message_id, author, body, posted_at):
+    line = MESSAGE_LINE_CACHE.get(message_id)
+    if line is None:
+        body = message_text(body).replace("\n", "\r\n    ")
+        line = f"#{message_id} [{format_timestamp(posted_at)}] {author}: {body}\r\n"
+        MESSAGE_LINE_CACHE.put(message_id, line)
+    return line
+
+def wrap_message(message_id, author, body, posted_at, width):
+    """
+    render_message word-wrapped to width columns, continuation lines
+    indented. Cached per (message id, width), so each wrap is computed once
+    per terminal size rather than once per reader.
+    """
+    width = max(width, MIN_WRAP_WIDTH)
+    key = (message_id, width)
+    text = WRAP_CACHE.get(key)
+    if text is None:
+        line = render_message(message_id, author, body, posted_at)
+        out = []
+        for part in line.rstrip("\r\n").split("\r\n"):
+            out.extend(textwrap.wrap(part, width=width, subsequent_indent="    ") or [""])
+        text = "\r\n".join(out) + "\r\n"
+        WRAP_CACHE.put(key, text)
+    return text
+
+def render_for(session, row, indent=""):
+    """Render a (id, author, body, posted_at) row for a session's terminal."""
+    width = session.width
+    if not width:
+        return indent + render_message(*row[:4])
+    text = wrap_message(*row[:4], width - len(indent))
+    if indent:
+        text = indent + text[:-2].replace("\r\n", "\r\n" + indent) + "\r\n"
+    return text
+
+###############################################################################
+# Output character sets
+###############################################################################
+
+# Codec names as normalized by codecs.lookup(), in menu order.
+CHARSETS = ["utf-8", "cp437", "iso8859-1"]
+CHARSET_LABELS = {"utf-8": "UTF-8", "cp437": "CP437 (IBM PC)", "iso8859-1": "Latin-1"}
+
+# Terminal types (TTYPE) that imply CP437 when the client does not
+# negotiate CHARSET itself.
+TERMINAL_CHARSETS = {"ansi": "cp437", "ansi-bbs": "cp437", "pcansi": "cp437", "syncterm": "cp437"}
+
+# Readable stand-ins for common characters a legacy charset lacks.
+CHARSET_FALLBACKS = {
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u201c": '"', "\u201d": '"',
+    "\u201e": '"', "\u2013": "-", "\u2014": "--", "\u2026": "...", "\u2022": "*",
+    "\u00a0": " ", "\u20ac": "EUR", "\u2122": "(TM)", "\u2190": "<-", "\u2192": "->",
+}
+
+def normalize_charset(name):
+    """Map a charset name or alias to one of CHARSETS, or None."""
+    try:
+        name = codecs.lookup(name.strip()).name
+    except (LookupError, AttributeError):
+        return None
+    return name if name in CHARSETS else None
+
+def build_translate_table(charset):
+    """
+    str.translate table for charset: punctuation fallbacks, then accented
+    Latin letters the charset lacks folded to their unaccented base.
+    """
+    def encodable(ch):
+        try:
+            ch.encode(charset)
+        except UnicodeEncodeError:
+            return False
+        return True
+
+    table = {}
+    for ch, fallback in CHARSET_FALLBACKS.items():
+        if not encodable(ch):
+            table[ord(ch)] = fallback
+    for code in range(0xA0, 0x250):
+        ch = chr(code)
+        if code in table or encodable(ch):
+            continue
+        base = unicodedata.normalize("NFKD", ch).encode("ascii", "ignore").decode()
+        if base:
+            table[code] = base
+    return table
+
+TRANSLATE_TABLES = {charset: build_translate_table(charset) for charset in CHARSETS[1:]}
+
+# (charset, text) -> encoded bytes for text shared between sessions
+# (menus, rendered messages), so each is encoded once per charset.
+SCREEN_CACHE = LRUCache(SCREEN_CACHE_SIZE)
+
+def encode_text(text, charset="utf-8"):
+    if charset == "utf-8":
+        return text.encode("utf-8", errors="ignore")
+    return text.translate(TRANSLATE_TABLES[charset]).encode(charset, errors="replace")
+
+def encode_screen(text, charset="utf-8"):
+    # A UTF-8 encode is a single C pass, cheaper than the cache lookup.
+    if charset == "utf-8":
+        return text.encode("utf-8", errors="ignore")
+    key = (charset, text)
+    data = SCREEN_CACHE.get(key)
+    if data is None:
+        data = encode_text(text, charset)
+        SCREEN_CACHE.put(key, data)
+    return data
 
 ###############################################################################
 # Telnet-ish I/O helpers
 ###############################################################################
 
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+OPT_TTYPE, OPT_NAWS, OPT_CHARSET = 24, 31, 42
+TTYPE_IS, TTYPE_SEND = 0, 1
+CHARSET_REQUEST, CHARSET_ACCEPTED = 1, 2
+TELNET_DO_NAWS = bytes([IAC, DO, OPT_NAWS])
+TELNET_DO_CHARSET = bytes([IAC, DO, OPT_TTYPE, IAC, DO, OPT_CHARSET])
+TELNET_TTYPE_SEND = bytes([IAC, SB, OPT_TTYPE, TTYPE_SEND, IAC, SE])
+TELNET_CHARSET_REQUEST = (bytes([IAC, SB, OPT_CHARSET, CHARSET_REQUEST])
+                          + b";UTF-8;IBM437;ISO-8859-1" + bytes([IAC, SE]))
+
+class TelnetReader:
+    """
+    StreamReader wrapper that strips telnet commands from the input and
+    records the client's window size from NAWS subnegotiation. Parsing is
+    stateful, so a sequence split across reads (or containing a 0x0A size
+    byte) is handled.
+
+    Given a writer it also answers WILL TTYPE / WILL CHARSET and picks the
+    output charset from the reply: an accepted CHARSET wins, otherwise the
+    terminal type may imply one.
+    """
+
+    _DATA, _IAC, _OPTION, _SB, _SB_IAC = range(5)
+
+    # Longest subnegotiation kept; NAWS, TTYPE and CHARSET replies fit easily.
+    # Past this the option is abandoned and the bytes are read as data, so an
+    # IAC SB that is never closed cannot buffer the client's input forever.
+    SB_MAX_BYTES = 64
+
+    def __init__(self, reader, writer=None):
+        self._reader = reader
+        self._writer = writer
+        self._state = self._DATA
+        self._command = None
+        self._sb = bytearray()
+        self._charset_accepted = False
+        self.width = None
+        self.height = None
+        self.terminal_type = None
+        self.charset = normalize_charset(DEFAULT_CHARSET) or "utf-8"
+        self.last_activity = time.monotonic()
+
+    def _filter(self, data):
+        out = bytearray()
+        for byte in data:
+            state = self._state
+            if state == self._DATA:
+                if byte == IAC:
+                    self._state = self._IAC
+                else:
+                    out.append(byte)
+            elif state == self._IAC:
+                if byte == IAC:
+                    out.append(IAC)
+                    self._state = self._DATA
+                elif byte == SB:
+                    self._sb.clear()
+                    self._state = self._SB
+                elif byte in (WILL, WONT, DO, DONT):
+                    self._command = byte
+                    self._state = self._OPTION
+                else:
+                    # A bare IAC before a line end must not swallow it, or
+                    # one line could grow past every size limit.
+                    if byte in b"\r\n":
+                        out.append(byte)
+                    self._state = self._DATA
+            elif state == self._OPTION:
+                self._option(self._command, byte)
+                self._state = self._DATA
+            elif state == self._SB:
+                if byte == IAC:
+                    self._state = self._SB_IAC
+                elif len(self._sb) < self.SB_MAX_BYTES:
+                    self._sb.append(byte)
+                else:
+                    self._sb.clear()
+                    out.append(byte)
+                    self._state = self._DATA
+            elif state == self._SB_IAC:
+                if byte == SE:
+                    self._subnegotiation(bytes(self._sb))
+                    self._state = self._DATA
+                elif len(self._sb) < self.SB_MAX_BYTES:
+                    self._sb.append(byte)
+                    self._state = self._SB
+                else:
+                    self._sb.clear()
+                    self._state = self._DATA
+        return bytes(out)
+
+    def _option(self, command, option):
+        if command != WILL or self._writer is None:
+            return
+        if option == OPT_TTYPE:
+            self._writer.write(TELNET_TTYPE_SEND)
+        elif option == OPT_CHARSET:
+            self._writer.write(TELNET_CHARSET_REQUEST)
+
+    def _subnegotiation(self, payload):
+        if len(payload) >= 5 and payload[0] == OPT_NAWS:
+            self.width = (payload[1] << 8) | payload[2]
+            self.height = (payload[3] << 8) | payload[4]
+        elif len(payload) >= 2 and payload[:2] == bytes([OPT_TTYPE, TTYPE_IS]):
+            self.terminal_type = payload[2:].decode("ascii", errors="ignore")
+            implied = TERMINAL_CHARSETS.get(self.terminal_type.lower())
+            if implied and not self._charset_accepted:
+                self.charset = implied
+        elif len(payload) >= 2 and payload[:2] == bytes([OPT_CHARSET, CHARSET_ACCEPTED]):
+            charset = normalize_charset(payload[2:].decode("ascii", errors="ignore"))
+            if charset:
+                self.charset = charset
+                self._charset_accepted = True
+
+    async def readline(self):
+        """
+        Like StreamReader.readline, but on filtered bytes: a line longer than
+        MAX_LINE_BYTES is read to its end, discarded and reported with
+        ValueError.
+        """
+        line = b""
+        while True:
+            data = await self._reader.readline()
+            if not data:
+                return line
+            self.last_activity = time.monotonic()
+            data = self._filter(data)
+            if len(line) <= MAX_LINE_BYTES:
+                line += data
+            if data.endswith(b"\n"):
+                if len(line) > MAX_LINE_BYTES:
+                    raise ValueError("line is longer than MAX_LINE_BYTES")
+                return line
+
+class TelnetWriter:
+    """StreamWriter wrapper carrying the session's output charset."""
+
+    def __init__(self, writer, charset="utf-8"):
+        self._writer = writer
+        self.charset = charset
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
 async def send(writer, data: str):
-    writer.write(data.encode("utf-8", errors="ignore"))
-    await writer.drain()
+    data = encode_text(data, getattr(writer, "charset", "utf-8"))
+    METRICS.inc("bbs_bytes_out_total", len(data))
+    with trace_span("send", "io", bytes=len(data)):
+        writer.write(data)
+        await writer.drain()
+
+async def send_screen(writer, parts):
+    """
+    Send shared text (menus, rendered messages) through the per-charset
+    screen cache instead of encoding it again for every session.
+    """
+    charset = getattr(writer, "charset", "utf-8")
+    data = b"".join(encode_screen(part, charset) for part in parts)
+    METRICS.inc("bbs_bytes_out_total", len(data))
+    with trace_span("send", "io", bytes=len(data)):
+        writer.write(data)
+        await writer.drain()
+
+# Timer of the menu action in progress; recv_line takes its waits out.
+ACTION_TIMER = contextvars.ContextVar("bbs_action_timer", default=None)
 
-async def recv_line(reader, timeout=300):
+async def recv_line(reader, timeout=300, secret=False):
     """
     Read one line with a timeout (idle kick).
     Naive telnet cleanup: strip CR/LF.
+    Lines are added to the session transcript when recording; secret ones
+    (passwords) only as placeholders.
     """
+    waiting = time.perf_counter()
     try:
         data = await asyncio.wait_for(reader.readline(), timeout=timeout)
     except asyncio.TimeoutError:
         return None
+    except ValueError:
+        # Line longer than the stream limit; StreamReader has already
+        # discarded it, so treat it as an empty line.
+        return ""
+    finally:
+        timer = ACTION_TIMER.get()
+        if timer is not None:
+            timer.exclude(time.perf_counter() - waiting)
     if not data:
         return None
-    line = data.decode("utf-8", errors="ignore").strip("\r\n")
+    METRICS.inc("bbs_bytes_in_total", len(data))
+    line = data.decode(getattr(reader, "charset", "utf-8"), errors="ignore").strip("\r\n")
+    transcript = TRANSCRIPT.get()
+    if transcript is not None:
+        transcript.add(line, secret)
     return line
 
 ###############################################################################
 # Session flow
 ###############################################################################
 
+# session id -> Session, for logged-in connections (see the admin port)
+SESSIONS = {}
+
+class Session:
+    """Per-connection state shared between the menu loop and background tasks."""
+
+    def __init__(self, reader, writer, username):
+        self.reader = reader
+        self.writer = writer
+        self.username = username
+        self.at_menu = asyncio.Event()
+        self.subscription = None
+        self.read_cursor = None  # (newest_id, oldest_id) of the page on screen
+        self.board_id = DEFAULT_BOARD_ID
+        self.board_name = "general"
+        self.sid = SESSION_ID.get()
+        self.peer = None
+        self.connected_at = time.time()
+
+    @property
+    def idle(self):
+        """Seconds since the client last sent anything, if known."""
+        last = getattr(self.reader, "last_activity", None)
+        return None if last is None else time.monotonic() - last
+
+    def buffered_bytes(self):
+        """Output accepted for this client but not yet sent."""
+        transport = getattr(self.writer, "transport", None)
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    @property
+    def width(self):
+        """Terminal width from NAWS, or None if the client never sent it."""
+        return getattr(self.reader, "width", None)
+
+    @property
+    def charset(self):
+        return getattr(self.writer, "charset", "utf-8")
+
+    def set_charset(self, charset):
+        """Switch both directions: output encoding and input decoding."""
+        self.writer.charset = charset
+        self.reader.charset = charset
+
+def render_push(event):
+    if "coalesced" in event:
+        return f"*** {event['coalesced']} new messages posted. Press 1 to read."
+    if PUSH_MODE == "post":
+        line = render_message(event["id"], event["author"], event["body"], event["posted_at"])
+        return "*** " + line.rstrip("\r\n")
+    return f"*** New message from {event['author']}. Press 1 to read."
+
+async def push_notifications(session):
+    """
+    Deliver hub events to one session, but only while it sits at the main
+    menu prompt so pushes never interleave with another screen's input.
+    """
+    try:
+        while True:
+            event = await session.subscription.get()
+            await session.at_menu.wait()
+            await send(session.writer, f"\r\n{ANSI_YELLOW}{render_push(event)}{ANSI_RESET}\r\nChoice?> ")
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+
 async def handle_login(reader, writer):
     await send(writer, WELCOME)
 
@@ -158,7 +2292,7 @@ async def handle_login(reader, writer):
     if row is None:
         # new user flow
         await send(writer, f"New user '{username}'. Create password: ")
-        pw = await recv_line(reader)
+        pw = await recv_line(reader, secret=True)
         if pw is None:
             return None
         try:
@@ -171,87 +2305,709 @@ async def handle_login(reader, writer):
         # login flow
         stored_user, stored_hash = row
         await send(writer, "Password: ")
-        pw = await recv_line(reader)
+        pw = await recv_line(reader, secret=True)
         if pw is None:
             return None
-        if not bcrypt.checkpw(pw.encode("utf-8"), stored_hash):
+        with METRICS.time("bbs_bcrypt_seconds", op="check"), trace_span("bcrypt.checkpw", "crypto"):
+            ok = bcrypt.checkpw(pw.encode("utf-8"), stored_hash)
+        if not ok:
             await send(writer, "Login failed.\r\n")
             return None
 
     return username
 
-async def do_read_messages(writer):
-    rows = list_messages(limit=10)
+async def do_read_messages(reader, writer, session):
+    board_id = session.board_id
+    # Fetch one extra row to learn whether an older page exists.
+    rows = latest_messages(board_id, READ_PAGE_SIZE + 1)
+    if not rows:
+        await send(writer, f"\r\nNo messages in {session.board_name} yet.\r\n\r\n")
+        return
+    has_older = len(rows) > READ_PAGE_SIZE
+    has_newer = False
+    rows = rows[:READ_PAGE_SIZE]
+    title = f"Latest Messages in {session.board_name}"
+
+    while True:
+        session.read_cursor = (rows[0][0], rows[-1][0])
+        lines = [f"\r\n--- {title} ---\r\n"]
+        lines.extend(render_for(session, row) for row in rows)
+        if not (has_older or has_newer):
+            await send_screen(writer, lines + ["\r\n"])
+            return
+
+        nav = []
+        if has_older:
+            nav.append("[N]ext older")
+        if has_newer:
+            nav.append("[P]rev newer")
+        nav.append("[Q]uit")
+        await send_screen(writer, lines + [" ".join(nav) + ": "])
+
+        cmd = await recv_line(reader)
+        if cmd is None:
+            return
+        cmd = cmd.strip().lower()
+        newest_id, oldest_id = session.read_cursor
+        if cmd == "n" and has_older:
+            page = list_messages_before(oldest_id, READ_PAGE_SIZE + 1, board_id)
+            has_older = len(page) > READ_PAGE_SIZE
+            has_newer = True
+            rows = page[:READ_PAGE_SIZE]
+            title = f"Older Messages in {session.board_name}"
+        elif cmd == "p" and has_newer:
+            page = list_messages_after(newest_id, READ_PAGE_SIZE + 1, board_id)
+            has_newer = len(page) > READ_PAGE_SIZE
+            has_older = True
+            rows = page[-READ_PAGE_SIZE:]
+            title = "Newer" if has_newer else "Latest"
+            title += f" Messages in {session.board_name}"
+        elif cmd in ("", "q"):
+            await send(writer, "\r\n")
+            return
+
+async def do_read_new_messages(reader, writer, session):
+    """Stream messages past the user's high-water mark, oldest first, in pages."""
+    board_id = session.board_id
+    last_read_id = get_last_read_id(session.username, board_id)
+    rows = list_messages_since(last_read_id, READ_PAGE_SIZE + 1, board_id)
     if not rows:
-        await send(writer, "\r\nNo messages yet.\r\n\r\n")
+        await send(writer, f"\r\nNo new messages in {session.board_name}.\r\n\r\n")
+        return
+
+    await send(writer, f"\r\n--- New Messages in {session.board_name} ---\r\n")
+    while True:
+        has_more = len(rows) > READ_PAGE_SIZE
+        rows = rows[:READ_PAGE_SIZE]
+        await send_screen(writer, [render_for(session, row) for row in rows])
+        last_read_id = rows[-1][0]
+        mark_read(session.username, last_read_id, board_id)
+        if not has_more:
+            await send(writer, "(end of new messages)\r\n\r\n")
+            return
+
+        await send(writer, "[Enter] more, [Q]uit: ")
+        cmd = await recv_line(reader)
+        if cmd is None or cmd.strip().lower() == "q":
+            await send(writer, "\r\n")
+            return
+        rows = list_messages_since(last_read_id, READ_PAGE_SIZE + 1, board_id)
+        if not rows:
+            await send(writer, "(end of new messages)\r\n\r\n")
+            return
+
+async def do_search(reader, writer, session):
+    await send(writer, "\r\nSearch for: ")
+    text = await recv_line(reader)
+    if text is None or not text.strip():
+        await send(writer, "Canceled.\r\n\r\n")
+        return
+
+    page = 0
+    while True:
+        rows = search_messages(text, limit=READ_PAGE_SIZE + 1, offset=page * READ_PAGE_SIZE)
+        if not rows and page == 0:
+            await send(writer, "No matches.\r\n\r\n")
+            return
+        has_more = len(rows) > READ_PAGE_SIZE
+        lines = [f"\r\n--- Results for '{text.strip()}' (page {page + 1}) ---\r\n"]
+        lines.extend(render_for(session, row) for row in rows[:READ_PAGE_SIZE])
+        if not has_more and page == 0:
+            await send_screen(writer, lines + ["\r\n"])
+            return
+
+        nav = []
+        if has_more:
+            nav.append("[N]ext")
+        if page > 0:
+            nav.append("[P]rev")
+        nav.append("[Q]uit")
+        await send_screen(writer, lines + [" ".join(nav) + ": "])
+
+        cmd = await recv_line(reader)
+        if cmd is None:
+            return
+        cmd = cmd.strip().lower()
+        if cmd == "n" and has_more:
+            page += 1
+        elif cmd == "p" and page > 0:
+            page -= 1
+        elif cmd in ("", "q"):
+            await send(writer, "\r\n")
+            return
+
+EDITOR_HELP = (
+    "Editor commands:\r\n"
+    "  .          finish and save\r\n"
+    "  /list      show the message so far\r\n"
+    "  /del N     delete line N\r\n"
+    "  /edit N    replace line N\r\n"
+    "  /clear     start over\r\n"
+    "  /abort     discard and return\r\n"
+)
+
+class MessageBuffer:
+    """
+    Lines of a message being composed, capped at max_bytes of UTF-8
+    (newlines included) so a client can't stream an unbounded post into
+    memory: lines that would overflow are refused as they arrive.
+    """
+
+    def __init__(self, max_bytes=MAX_MESSAGE_BYTES):
+        self.max_bytes = max_bytes
+        self.lines = []
+        self.size = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    @staticmethod
+    def _cost(line):
+        return len(line.encode("utf-8")) + 1
+
+    def remaining(self):
+        return max(self.max_bytes - self.size, 0)
+
+    def append(self, line):
+        cost = self._cost(line)
+        if self.size + cost > self.max_bytes + 1:  # no newline after the last line
+            return False
+        self.lines.append(line)
+        self.size += cost
+        return True
+
+    def replace(self, index, line):
+        delta = self._cost(line) - self._cost(self.lines[index])
+        if self.size + delta > self.max_bytes + 1:
+            return False
+        self.lines[index] = line
+        self.size += delta
+        return True
+
+    def delete(self, index):
+        self.size -= self._cost(self.lines.pop(index))
+
+    def clear(self):
+        self.lines = []
+        self.size = 0
+
+    def text(self):
+        return "\n".join(self.lines).strip("\n")
+
+def parse_line_number(arg, buf):
+    """1-based line number from an editor command argument, as an index."""
+    if not arg.isdigit() or not 1 <= int(arg) <= len(buf):
+        return None
+    return int(arg) - 1
+
+async def run_editor(reader, writer, max_bytes=MAX_MESSAGE_BYTES):
+    """
+    Collect a multi-line message. Returns the text, "" if aborted or empty,
+    or None if the connection went away.
+    """
+    buf = MessageBuffer(max_bytes)
+    await send(writer, f"Multi-line editor ({max_bytes} bytes max). "
+                       "End with '.' alone on a line, /help for commands.\r\n")
+    while True:
+        await send(writer, f"{len(buf) + 1:>3}> ")
+        line = await recv_line(reader)
+        if line is None:
+            return None
+        line = line.rstrip()
+        cmd, _, arg = line.strip().partition(" ")
+        arg = arg.strip()
+
+        if line.strip() == ".":
+            return buf.text()
+        elif cmd == "/abort":
+            return ""
+        elif cmd == "/help":
+            await send(writer, EDITOR_HELP)
+        elif cmd == "/list":
+            listing = "".join(f"{i:>3}: {text}\r\n" for i, text in enumerate(buf.lines, 1))
+            await send(writer, (listing or "(empty)\r\n")
+                       + f"({buf.size} bytes, {buf.remaining()} left)\r\n")
+        elif cmd == "/clear":
+            buf.clear()
+            await send(writer, "Cleared.\r\n")
+        elif cmd == "/del":
+            index = parse_line_number(arg, buf)
+            if index is None:
+                await send(writer, "No such line.\r\n")
+            else:
+                buf.delete(index)
+        elif cmd == "/edit":
+            index = parse_line_number(arg, buf)
+            if index is None:
+                await send(writer, "No such line.\r\n")
+                continue
+            await send(writer, f"{index + 1:>3}: {buf.lines[index]}\r\nnew> ")
+            new = await recv_line(reader)
+            if new is None:
+                return None
+            if not buf.replace(index, new.rstrip()):
+                await send(writer, f"Too long: only {buf.remaining()} bytes left.\r\n")
+        elif not buf.append(line):
+            await send(writer, f"Line rejected: the message is limited to {max_bytes} bytes "
+                               f"({buf.remaining()} left). '.' to finish.\r\n")
+
+async def prompt_body(reader, writer, what):
+    """
+    Ask for a message body: one line by default, or the multi-line editor
+    when the user types /edit. Returns the text, "" to cancel, or None if
+    the connection went away.
+    """
+    await send(writer, f"\r\nEnter {what} (one line), or /edit for the multi-line editor:\r\n> ")
+    line = await recv_line(reader)
+    if line is None:
+        return None
+    if line.strip() == "/edit":
+        return await run_editor(reader, writer)
+    body = line.strip()
+    if len(body.encode("utf-8")) > MAX_MESSAGE_BYTES:
+        await send(writer, f"Too long: messages are limited to {MAX_MESSAGE_BYTES} bytes.\r\n")
+        return ""
+    return body
+
+async def check_flood(writer, username, body=None):
+    """
+    Apply POST_GUARD before a write, telling the user why when refused.
+    Without a body only the rate limit is checked (before prompting).
+    """
+    if body is None:
+        wait = POST_GUARD.retry_after(username)
+        if wait > 0:
+            await send(writer, f"\r\nSlow down: at most {POST_GUARD.max_posts} posts per "
+                               f"{POST_GUARD.window:g}s. Try again in {wait:.0f}s.\r\n\r\n")
+            return False
+        return True
+
+    verdict = POST_GUARD.check(username, body)
+    if verdict == "rate":
+        await send(writer, f"Slow down: at most {POST_GUARD.max_posts} posts per "
+                           f"{POST_GUARD.window:g}s. Not posted.\r\n\r\n")
+        return False
+    if verdict == "duplicate":
+        await send(writer, "Duplicate of a message you just sent. Not posted.\r\n\r\n")
+        return False
+    return True
+
+THREAD_MAX_INDENT = 8
+
+async def do_thread(reader, writer, session):
+    await send(writer, "\r\nThread of message #: ")
+    choice = await recv_line(reader)
+    if choice is None or not choice.strip().lstrip("#").isdigit():
+        await send(writer, "Canceled.\r\n\r\n")
+        return
+    message = get_message(int(choice.strip().lstrip("#")))
+    if message is None:
+        await send(writer, "No such message.\r\n\r\n")
+        return
+    board_id, thread_id = message[1], message[2]
+
+    rows = get_thread(thread_id)
+    lines = [f"\r\n--- Thread #{thread_id} ({rows[0][5]} replies) ---\r\n"]
+    for message_id, author, body, posted_at, depth, _ in rows:
+        indent = "  " * min(depth, THREAD_MAX_INDENT)
+        lines.append(render_for(session, (message_id, author, body, posted_at), indent))
+    await send_screen(writer, lines + ["Reply to # (Enter to return): "])
+
+    choice = await recv_line(reader)
+    if choice is None or not choice.strip():
+        await send(writer, "\r\n")
+        return
+    parent_id = choice.strip().lstrip("#")
+    if not parent_id.isdigit() or int(parent_id) not in {row[0] for row in rows}:
+        await send(writer, "That message is not in this thread.\r\n\r\n")
+        return
+
+    if not await check_flood(writer, session.username):
+        return
+    body = await prompt_body(reader, writer, f"reply to #{parent_id}")
+    if not body:
+        await send(writer, "Canceled.\r\n\r\n")
+        return
+    if not await check_flood(writer, session.username, body):
         return
-    await send(writer, "\r\n--- Latest Messages ---\r\n")
-    for author, body, ts in rows:
-        await send(writer, f"[{ts}] {author}: {body}\r\n")
-    await send(writer, "\r\n")
-
-async def do_post_message(reader, writer, username):
-    await send(writer, "\r\nEnter message (one line):\r\n> ")
-    body = await recv_line(reader)
+    post_message(session.username, body, board_id, parent_id=int(parent_id))
+    await send(writer, "Replied.\r\n\r\n")
+
+async def do_post_message(reader, writer, session):
+    if not await check_flood(writer, session.username):
+        return
+    body = await prompt_body(reader, writer, f"message for {session.board_name}")
     if body is None:
         await send(writer, "\r\nTimed out.\r\n\r\n")
         return
-    body = body.strip()
     if body:
-        post_message(username, body)
+        if not await check_flood(writer, session.username, body):
+            return
+        post_message(session.username, body, session.board_id)
         await send(writer, "Posted.\r\n\r\n")
     else:
         await send(writer, "Canceled.\r\n\r\n")
 
-async def do_who(writer):
-    current = await list_active_users()
-    await send(writer, "\r\n--- Users Online ---\r\n")
-    if not current:
-        await send(writer, "(nobody)\r\n\r\n")
+async def do_boards(reader, writer, session):
+    boards = list_boards()
+    lines = ["\r\n--- Boards ---\r\n"]
+    for board_id, name, description in boards:
+        marker = "*" if board_id == session.board_id else " "
+        lines.append(f"{marker}[{board_id}] {name} - {description}\r\n")
+    await send(writer, "".join(lines) + "Board number or name (Enter to keep current): ")
+
+    choice = await recv_line(reader)
+    if choice is None or not choice.strip():
+        await send(writer, "\r\n")
+        return
+    board = get_board(choice.strip())
+    if board is None:
+        await send(writer, "No such board.\r\n\r\n")
+        return
+    session.board_id, session.board_name, _ = board
+    if session.subscription is not None:
+        session.subscription.set_board(session.board_id)
+    await send(writer, f"Now on board '{session.board_name}'.\r\n\r\n")
+
+async def do_charset(reader, writer, session):
+    lines = ["\r\n--- Character Set ---\r\n"]
+    for number, charset in enumerate(CHARSETS, 1):
+        marker = "*" if charset == session.charset else " "
+        lines.append(f"{marker}[{number}] {CHARSET_LABELS[charset]}\r\n")
+    await send(writer, "".join(lines) + "Choice (Enter to keep current): ")
+
+    choice = await recv_line(reader)
+    if choice is None or not choice.strip():
+        await send(writer, "\r\n")
+        return
+    choice = choice.strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(CHARSETS):
+        charset = CHARSETS[int(choice) - 1]
+    else:
+        charset = normalize_charset(choice)
+    if charset is None:
+        await send(writer, "Unknown character set.\r\n\r\n")
+        return
+    session.set_charset(charset)
+    await send(writer, f"Now using {CHARSET_LABELS[charset]}.\r\n\r\n")
+
+async def do_mail(reader, writer, session):
+    before_id = None
+    while True:
+        unread, total = get_mailbox_counts(session.username)
+        rows = list_mailbox(session.username, before_id, READ_PAGE_SIZE + 1)
+        has_older = len(rows) > READ_PAGE_SIZE
+        rows = rows[:READ_PAGE_SIZE]
+
+        lines = [f"\r\n--- Private Mail ({unread} new, {total} total) ---\r\n"]
+        for message_id, sender, body, sent_at, read_at in rows:
+            marker = "*" if read_at is None else " "
+            lines.append(f"{marker}#{message_id} [{format_timestamp(sent_at)}] {sender}: {body}\r\n")
+        if not rows:
+            lines.append("(empty)\r\n")
+        mark_mailbox_read(session.username, [row[0] for row in rows if row[4] is None])
+
+        nav = ["[S]end"]
+        if has_older:
+            nav.append("[N]ext older")
+        nav.append("[Q]uit")
+        await send(writer, "".join(lines) + " ".join(nav) + ": ")
+
+        cmd = await recv_line(reader)
+        if cmd is None:
+            return
+        cmd = cmd.strip().lower()
+        if cmd == "n" and has_older:
+            before_id = rows[-1][0]
+        elif cmd == "s":
+            await do_send_mail(reader, writer, session)
+            before_id = None
+        elif cmd in ("", "q"):
+            await send(writer, "\r\n")
+            return
+
+async def do_send_mail(reader, writer, session):
+    await send(writer, "To: ")
+    recipient = await recv_line(reader)
+    if recipient is None or not recipient.strip():
+        await send(writer, "Canceled.\r\n")
+        return
+    recipient = recipient.strip()
+    if get_user(recipient) is None:
+        await send(writer, f"No such user '{recipient}'.\r\n")
         return
-    for u in current:
-        await send(writer, f"- {u}\r\n")
-    await send(writer, "\r\n")
+    if not await check_flood(writer, session.username):
+        return
+    body = await prompt_body(reader, writer, f"private message to {recipient}")
+    if not body:
+        await send(writer, "Canceled.\r\n")
+        return
+    if not await check_flood(writer, session.username, body):
+        return
+    send_private_message(session.username, recipient, body)
+    await send(writer, f"Sent to {recipient}.\r\n")
+
+async def do_who(reader, writer):
+    prefix = ""
+    page = 0
+    while True:
+        total, matched, page, names = await who_page(prefix, page)
+        pages = max((matched + WHO_PAGE_SIZE - 1) // WHO_PAGE_SIZE, 1)
+
+        header = f"\r\n--- Users Online ({total}) ---\r\n"
+        if prefix:
+            header += f"Filter '{prefix}': {matched} match(es)\r\n"
+        lines = [f"- {u}\r\n" for u in names] or ["(nobody)\r\n"]
+        if pages == 1 and not prefix:
+            await send(writer, header + "".join(lines) + "\r\n")
+            return
+
+        await send(
+            writer,
+            header + "".join(lines)
+            + f"Page {page + 1}/{pages}  [N]ext [P]rev [/prefix] filter [Q]uit: "
+        )
+        cmd = await recv_line(reader)
+        if cmd is None:
+            return
+        cmd = cmd.strip()
+        if cmd.lower() == "n":
+            page += 1
+        elif cmd.lower() == "p":
+            page -= 1
+        elif cmd.startswith("/"):
+            prefix = cmd[1:].strip()
+            page = 0
+        elif cmd == "" or cmd.lower() == "q":
+            await send(writer, "\r\n")
+            return
+
+MENU_ACTIONS = {
+    "1": "read", "n": "read_new", "2": "post", "t": "thread", "s": "search",
+    "b": "boards", "m": "mail", "c": "charset", "3": "who", "4": "logout",
+}
 
 async def session_task(reader, writer):
+    SESSION_ID.set(next(SESSION_IDS))
+    TRACING.set(TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE)
+    transcript = RECORDER.transcript()
+    TRANSCRIPT.set(transcript)
+    METRICS.inc("bbs_connections_total")
+    METRICS.add("bbs_sessions", 1)
+    try:
+        await run_session(reader, writer)
+    finally:
+        METRICS.add("bbs_sessions", -1)
+        if transcript is not None:
+            RECORDER.save(transcript)
+
+async def run_session(reader, writer):
     addr = writer.get_extra_info("peername")
-    print(f"[+] Connection from {addr}", flush=True)
+    connected_at = time.time()
+    log_event("connect", peer=addr)
 
-    username = await handle_login(reader, writer)
+    reader = TelnetReader(reader, writer)
+    if TELNET_NAWS:
+        writer.write(TELNET_DO_NAWS)
+    if TELNET_CHARSET:
+        writer.write(TELNET_DO_CHARSET)
+    writer = TelnetWriter(writer, reader.charset)
+
+    with trace_span("login", "session"):
+        username = await handle_login(reader, writer)
     if username is None:
         await send(writer, "Goodbye.\r\n")
         writer.close()
         await writer.wait_closed()
-        print(f"[-] {addr} login failed / disconnected", flush=True)
+        log_event("login_failed", peer=addr)
         return
 
     await add_active_user(username)
+    log_event("login", user=username)
+    trace_thread_name(f"session {SESSION_ID.get()} ({username})")
     await send(writer, f"\r\nWelcome, {username}!\r\n")
+    unread, _ = get_mailbox_counts(username)
+    if unread:
+        await send(writer, f"{ANSI_YELLOW}You have {unread} new private message(s). Press M to read.{ANSI_RESET}\r\n")
+
+    session = Session(reader, writer, username)
+    session.peer, session.connected_at = addr, connected_at
+    # Negotiation replies have arrived by now (they precede the username).
+    session.set_charset(reader.charset)
+    SESSIONS[session.sid] = session
+    pusher = None
+    if PUSH_MODE != "off":
+        session.subscription = HUB.subscribe(username)
+        pusher = asyncio.create_task(push_notifications(session))
 
     try:
         while True:
-            await send(writer, MAIN_MENU)
+            await send_screen(writer, [MAIN_MENU])
+            session.at_menu.set()
             choice = await recv_line(reader)
+            session.at_menu.clear()
             if choice is None:
                 await send(writer, "\r\nIdle timeout. Later.\r\n")
                 break
 
-            if choice == "1":
-                await do_read_messages(writer)
-            elif choice == "2":
-                await do_post_message(reader, writer, username)
-            elif choice == "3":
-                await do_who(writer)
-            elif choice == "4":
-                await send(writer, "Logging out...\r\n")
-                break
-            else:
-                await send(writer, "Invalid option.\r\n")
+            action = MENU_ACTIONS.get(choice.lower(), "invalid")
+            with METRICS.time("bbs_menu_action_seconds", action=action) as timer, \
+                    trace_span(action, "handler"):
+                ACTION_TIMER.set(timer)
+                if choice == "1":
+                    await do_read_messages(reader, writer, session)
+                elif choice.lower() == "n":
+                    await do_read_new_messages(reader, writer, session)
+                elif choice == "2":
+                    await do_post_message(reader, writer, session)
+                elif choice.lower() == "t":
+                    await do_thread(reader, writer, session)
+                elif choice.lower() == "s":
+                    await do_search(reader, writer, session)
+                elif choice.lower() == "b":
+                    await do_boards(reader, writer, session)
+                elif choice.lower() == "m":
+                    await do_mail(reader, writer, session)
+                elif choice.lower() == "c":
+                    await do_charset(reader, writer, session)
+                elif choice == "3":
+                    await do_who(reader, writer)
+                elif choice == "4":
+                    await send(writer, "Logging out...\r\n")
+                    break
+                else:
+                    await send(writer, "Invalid option.\r\n")
+            ACTION_TIMER.set(None)
+            log_event("menu_action", sample=LOG_SAMPLE_RATE,
+                      action=action, ms=round(timer.elapsed * 1000, 2))
     finally:
+        if pusher is not None:
+            HUB.unsubscribe(session.subscription)
+            pusher.cancel()
+        SESSIONS.pop(session.sid, None)
         await remove_active_user(username)
         writer.close()
         await writer.wait_closed()
-        print(f"[-] {addr} disconnected ({username})", flush=True)
+        log_event("disconnect", user=username)
+
+###############################################################################
+# Admin control port (localhost only, in-memory state only)
+###############################################################################
+
+ADMIN_HELP = """Commands:
+  sessions             list logged-in sessions
+  kick <sid>           disconnect a session
+  broadcast <text>     send a notice to every session
+  flush                clear the read-path and screen caches
+  metrics              dump the metrics exposition
+  profile [seconds]    start (or stop) the profiler
+  record               start (or stop) recording session transcripts
+  quit
+"""
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+def admin_sessions():
+    lines = [f"{'SID':>5}  {'USER':<16} {'PEER':<22} {'ONLINE':>7} {'IDLE':>7} {'BUFFERED':>8}  SCREEN"]
+    now = time.time()
+    for sid, session in sorted(SESSIONS.items()):
+        peer = ":".join(str(part) for part in session.peer[:2]) if session.peer else "-"
+        idle = session.idle
+        lines.append(
+            f"{sid:>5}  {session.username:<16} {peer:<22} "
+            f"{format_duration(now - session.connected_at):>7} "
+            f"{format_duration(idle) if idle is not None else '-':>7} "
+            f"{session.buffered_bytes():>8}  {'menu' if session.at_menu.is_set() else 'busy'}"
+        )
+    lines.append(f"{len(SESSIONS)} session(s)")
+    return "\n".join(lines) + "\n"
+
+def admin_kick(arg):
+    if not arg.isdigit() or int(arg) not in SESSIONS:
+        return f"error: no session {arg!r}\n"
+    session = SESSIONS[int(arg)]
+    session.writer.write(encode_text("\r\n*** Disconnected by the sysop.\r\n", session.charset))
+    # Closing the transport ends the session's pending read with EOF, so the
+    # session task runs its own cleanup.
+    session.writer.close()
+    log_event("kicked", target_sid=int(arg), user=session.username)
+    return f"kicked {session.username} (sid {arg})\n"
+
+def admin_broadcast(text):
+    if not text:
+        return "error: nothing to broadcast\n"
+    for session in SESSIONS.values():
+        # No drain: a slow client only grows its own buffer.
+        session.writer.write(encode_text(f"\r\n*** SYSOP: {text}\r\n", session.charset))
+    log_event("broadcast", sessions=len(SESSIONS), text=text)
+    return f"sent to {len(SESSIONS)} session(s)\n"
+
+def admin_flush():
+    entries = len(MESSAGE_LINE_CACHE) + len(WRAP_CACHE) + len(SCREEN_CACHE) + len(BOARD_LATEST_CACHE)
+    clear_caches()
+    return f"cleared {entries} cache entries\n"
+
+def admin_profile(arg):
+    if PROFILER.running:
+        return f"wrote {PROFILER.stop()}\n"
+    if arg and not arg.replace(".", "", 1).isdigit():
+        return "error: seconds must be a number\n"
+    return f"profiling to {PROFILER.start(float(arg) if arg else PROFILE_SECONDS)}\n"
+
+def admin_record():
+    if RECORDER.running:
+        return f"wrote {RECORDER.stop()}\n"
+    return f"recording to {RECORDER.start()}\n"
+
+def admin_command(line):
+    """Run one admin command line and return its reply text."""
+    command, _, arg = line.strip().partition(" ")
+    command, arg = command.lower(), arg.strip()
+    if command == "sessions":
+        return admin_sessions()
+    if command == "kick":
+        return admin_kick(arg)
+    if command == "broadcast":
+        return admin_broadcast(arg)
+    if command == "flush":
+        return admin_flush()
+    if command == "metrics":
+        return METRICS.render()
+    if command == "profile":
+        return admin_profile(arg)
+    if command == "record":
+        return admin_record()
+    if command in ("help", "?", ""):
+        return ADMIN_HELP
+    return f"error: unknown command {command!r} (try 'help')\n"
+
+async def admin_handler(reader, writer):
+    peer = writer.get_extra_info("peername")
+    if not peer or not ipaddress.ip_address(peer[0]).is_loopback:
+        writer.close()
+        return
+    log_event("admin_connect", peer=peer)
+    try:
+        writer.write(b"py-bbs admin. Type 'help' for commands.\nadmin> ")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.decode("utf-8", errors="replace")
+            if line.strip().lower() in ("quit", "exit"):
+                break
+            writer.write((admin_command(line) + "admin> ").encode("utf-8"))
+            await writer.drain()
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
 
 ###############################################################################
 # Graceful shutdown handling
@@ -261,30 +3017,60 @@ stop_event = asyncio.Event()
 
 def handle_sigterm():
     # Let asyncio loop exit cleanly
-    print("[!] Received shutdown signal", flush=True)
+    log_event("shutdown_signal")
     stop_event.set()
 
 async def main():
+    log_listener = setup_logging()
+    trace_listener = setup_tracing() if TRACE_SAMPLE_RATE > 0 else None
     init_db()
+    if RECORD_SESSIONS:
+        RECORDER.start()
+    flusher = asyncio.create_task(read_mark_flusher())
+    if LAG_THRESHOLD_MS > 0:
+        LOOP_WATCHDOG.start()
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, PROFILER.toggle)
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = await asyncio.start_server(metrics_handler, METRICS_HOST, METRICS_PORT)
+        log_event("metrics_listening", url=f"http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    admin_server = None
+    if ADMIN_PORT:
+        admin_server = await asyncio.start_server(admin_handler, "127.0.0.1", ADMIN_PORT)
+        log_event("admin_listening", port=ADMIN_PORT)
 
     # Start TCP server
     server = await asyncio.start_server(
         session_task,
         host="0.0.0.0",
         port=BBS_PORT,
+        limit=MAX_LINE_BYTES,
         start_serving=True
     )
 
-    addr_list = ", ".join(str(sock.getsockname()) for sock in server.sockets)
-    print(f"[BBS] Listening on {addr_list}", flush=True)
+    log_event("listening", addresses=[sock.getsockname() for sock in server.sockets])
 
     # Wait until we get SIGTERM or SIGINT
     await stop_event.wait()
 
-    print("[BBS] Shutting down listener...", flush=True)
+    log_event("shutting_down")
     server.close()
     await server.wait_closed()
-    print("[BBS] Bye.", flush=True)
+    for side_server in (metrics_server, admin_server):
+        if side_server is not None:
+            side_server.close()
+            await side_server.wait_closed()
+    flusher.cancel()
+    if LAG_THRESHOLD_MS > 0:
+        LOOP_WATCHDOG.stop()
+    PROFILER.stop()
+    RECORDER.stop()
+    flush_read_marks()
+    log_event("stopped")
+    if trace_listener is not None:
+        trace_listener.stop()
+    log_listener.stop()
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
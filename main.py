@@ -59,6 +59,20 @@ For more information, see README.md or AGENT.md
         help='Host to bind to (default: 0.0.0.0)'
     )
     
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=None,
+        help='Serve Prometheus metrics over HTTP on this port (default: off)'
+    )
+    
+    parser.add_argument(
+        '--admin-port',
+        type=int,
+        default=None,
+        help='Serve the admin console on 127.0.0.1 at this port (default: off)'
+    )
+    
     parser.add_argument(
         '--init-only',
         action='store_true',
@@ -80,6 +94,15 @@ def setup_environment(args):
     os.environ['BBS_PORT'] = str(args.port)
     os.environ['BBS_DB_PATH'] = args.db_path
     
+    # bbs_server is already imported, so options read at import time are
+    # set on the module directly as well.
+    if args.metrics_port is not None:
+        os.environ['BBS_METRICS_PORT'] = str(args.metrics_port)
+        bbs_server.METRICS_PORT = args.metrics_port
+    if args.admin_port is not None:
+        os.environ['BBS_ADMIN_PORT'] = str(args.admin_port)
+        bbs_server.ADMIN_PORT = args.admin_port
+    
     # Ensure database directory exists
     db_path = Path(args.db_path)
     db_path.parent.mkdir(parents=True, exist_ok=True)
@@ -89,6 +112,10 @@ def setup_environment(args):
     print(f"   Port: {args.port}")
     print(f"   Database: {args.db_path}")
     print(f"   Database directory: {db_path.parent}")
+    if args.metrics_port is not None:
+        print(f"   Metrics: http://{bbs_server.METRICS_HOST}:{args.metrics_port}/metrics")
+    if args.admin_port is not None:
+        print(f"   Admin console: nc 127.0.0.1 {args.admin_port}")
 
 
 def main():
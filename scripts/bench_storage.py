@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Storage micro-benchmarks with a committed baseline and a regression gate.
+
+Times get_user, create_user, list_messages and post_message against
+databases seeded with different numbers of messages, reports ops/sec and
+latency percentiles, and compares the medians with a stored baseline. The
+exit status is 1 when any benchmark is slower than the baseline by more than
+the tolerance, so the run can gate CI.
+
+Baselines are only comparable on the same machine; refresh the committed one
+with --save-baseline when the hardware or an intended trade-off changes.
+
+Usage:
+    uv run python scripts/bench_storage.py                       # compare with baseline
+    uv run python scripts/bench_storage.py --sizes 1000,1000000 --db-dir /tmp/bench
+    uv run python scripts/bench_storage.py --save-baseline       # record a new baseline
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import bcrypt
+
+import bbs_server
+
+DEFAULT_BASELINE = Path(__file__).parent.parent / "benchmarks" / "storage_baseline.json"
+DEFAULT_SIZES = "1000,10000,100000"
+
+# benchmark -> default iterations (create_user is dominated by bcrypt)
+BENCHMARKS = {
+    "get_user": 500,
+    "create_user": 5,
+    "list_messages": 500,
+    "post_message": 200,
+}
+WARMUP = 3
+ROUNDS = 3
+SEED_BATCH = 50000
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def seed_database(db_path, messages):
+    """
+    Create a database holding `messages` posts by a pool of users. Reuses
+    db_path if it was already seeded to that size (large sizes take a while),
+    first trimming the rows earlier write benchmarks added on top of the seed.
+    Returns the list of seeded usernames.
+    """
+    users = max(100, min(messages // 10, 100000))
+    usernames = [f"bench{i}" for i in range(users)]
+    bbs_server.DB_PATH = str(db_path)
+    bbs_server.init_db()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS bench_seed (messages INTEGER, last_message_id INTEGER, last_user_rowid INTEGER)")
+    seed = conn.execute("SELECT messages, last_message_id, last_user_rowid FROM bench_seed").fetchone()
+    if seed is not None and seed[0] == messages:
+        conn.execute("DELETE FROM messages WHERE id > ?", (seed[1],))
+        conn.execute("DELETE FROM users WHERE rowid > ?", (seed[2],))
+        conn.commit()
+        conn.close()
+        return usernames
+
+    conn.execute("DELETE FROM bench_seed")
+    conn.execute("DELETE FROM messages")
+    conn.execute("DELETE FROM users")
+    # One cheap hash for every seeded account; only create_user pays for bcrypt.
+    password_hash = bcrypt.hashpw(b"bench", bcrypt.gensalt(rounds=4))
+    conn.executemany(
+        "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
+        ((name, password_hash, 0) for name in usernames),
+    )
+    rng = random.Random(42)
+    start_ms = bbs_server.now_ms() - messages * 1000
+    for first in range(0, messages, SEED_BATCH):
+        conn.executemany(
+            "INSERT INTO messages (board_id, author, body, compressed, posted_at) VALUES (1, ?, ?, 0, ?)",
+            (
+                (rng.choice(usernames), f"benchmark message {n} " + "lorem ipsum " * rng.randint(1, 8),
+                 start_ms + n * 1000)
+                for n in range(first, min(first + SEED_BATCH, messages))
+            ),
+        )
+        conn.commit()
+    conn.execute(
+        "INSERT INTO bench_seed VALUES (?, (SELECT COALESCE(MAX(id), 0) FROM messages), "
+        "(SELECT COALESCE(MAX(rowid), 0) FROM users))",
+        (messages,),
+    )
+    conn.commit()
+    conn.close()
+    return usernames
+
+
+def measure(func, iterations, rounds=ROUNDS):
+    """
+    Time iterations calls, rounds times over, and report the round with the
+    lowest median: like timeit's best-of-N, this filters out interference
+    from the rest of the machine, which only ever makes a round slower.
+    """
+    for _ in range(WARMUP):
+        func()
+    best = None
+    for _ in range(rounds):
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        if best is None or percentile(latencies, 50) < percentile(best, 50):
+            best = latencies
+    latencies = best
+    total = sum(latencies)
+    return {
+        "iterations": iterations,
+        "rounds": rounds,
+        "ops_per_sec": round(iterations / total, 1) if total else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "max_ms": round(latencies[-1] * 1000, 4),
+    }
+
+
+def run_size(db_path, size, iterations=None, rounds=ROUNDS):
+    """Run every benchmark against a database seeded with size messages."""
+    usernames = seed_database(db_path, size)
+    bbs_server.clear_caches()
+    rng = random.Random(size)
+    created = iter(range(10 ** 9))
+
+    cases = {
+        "get_user": lambda: bbs_server.get_user(rng.choice(usernames)),
+        "create_user": lambda: bbs_server.create_user(f"new{size}_{next(created)}_{time.time_ns()}", "pw"),
+        "list_messages": lambda: bbs_server.list_messages(limit=10),
+        "post_message": lambda: bbs_server.post_message(rng.choice(usernames), "benchmark post"),
+    }
+    return {
+        name: measure(cases[name], iterations or default, rounds)
+        for name, default in BENCHMARKS.items()
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms=0.0):
+    """
+    Return a description of every median slower than baseline * (1 + tolerance)
+    and by more than min_delta_ms, so sub-millisecond scheduler jitter on the
+    fastest operations cannot fail the gate on its own.
+    """
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, current in benchmarks.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None or not base["p50_ms"]:
+                continue
+            limit = base["p50_ms"] * (1 + tolerance)
+            if current["p50_ms"] > limit and current["p50_ms"] - base["p50_ms"] > min_delta_ms:
+                regressions.append(
+                    f"{name} @ {size} messages: p50 {current['p50_ms']:.3f}ms "
+                    f"vs baseline {base['p50_ms']:.3f}ms (+{current['p50_ms'] / base['p50_ms'] - 1:.0%})"
+                )
+    return regressions
+
+
+def print_results(size, benchmarks):
+    print(f"\n📊 {size:,} messages")
+    print(f"  {'benchmark':<14} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for name, row in benchmarks.items():
+        print(f"  {name:<14} {row['ops_per_sec']:>10} {row['p50_ms']:>10} {row['p95_ms']:>10} "
+              f"{row['p99_ms']:>10} {row['max_ms']:>10}")
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="BBS storage benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"Comma-separated message counts to seed (default: {DEFAULT_SIZES})")
+    parser.add_argument("--iterations", type=int, default=None,
+                        help="Iterations per benchmark (default: per-benchmark, see BENCHMARKS)")
+    parser.add_argument("--rounds", type=int, default=ROUNDS,
+                        help=f"Rounds per benchmark; the round with the best median is kept (default: {ROUNDS})")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE),
+                        help="Baseline JSON to compare against or save to")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed median slowdown before failing, as a fraction (default: 0.5)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.25,
+                        help="Ignore slowdowns smaller than this many milliseconds (default: 0.25)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write this run as the new baseline instead of comparing")
+    parser.add_argument("--json", default=None, help="Also write this run's results to a JSON file")
+    parser.add_argument("--db-dir", default=None,
+                        help="Keep seeded databases here and reuse them on later runs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    db_dir = Path(args.db_dir) if args.db_dir else Path(tempfile.mkdtemp(prefix="bbs-bench-"))
+    db_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    try:
+        for size in sizes:
+            started = time.perf_counter()
+            results[str(size)] = run_size(db_dir / f"bench-{size}.sqlite3", size, args.iterations, args.rounds)
+            print_results(size, results[str(size)])
+            print(f"  ({time.perf_counter() - started:.1f}s including seeding)")
+    finally:
+        if not args.db_dir:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    report = {"machine": machine_info(), "results": results}
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\n✅ Results written to {args.json}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\n✅ Baseline saved to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"\n⚠️  No baseline at {baseline_path}; run with --save-baseline to create one.")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline.get("machine") != report["machine"]:
+        print("\n⚠️  Baseline was recorded on a different machine or toolchain; comparing anyway.")
+    regressions = compare(results, baseline.get("results", {}), args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"\n✅ No regressions beyond {args.tolerance:.0%} of baseline medians.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,6 +16,10 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import bbs_server
 
+# Changes made here only clear this process's caches, not a running server's.
+STALE_CACHE_WARNING = ("⚠️  A running server keeps showing its cached copies until "
+                       "'flush' is run on its admin console (or it restarts).")
+
 
 def reset_database():
     """Reset the database by clearing all data."""
@@ -28,7 +32,7 @@ def reset_database():
 
 def backup_database():
     """Create a backup of the current database."""
-    import shutil
+    import sqlite3
     import datetime
     
     db_path = bbs_server.DB_PATH
@@ -39,8 +43,17 @@ def backup_database():
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_path = f"{db_path}.backup_{timestamp}"
     
-    shutil.copy2(db_path, backup_path)
+    # The database runs in WAL mode, so recent commits may still live in the
+    # -wal file; SQLite's online backup copies a consistent snapshot of both,
+    # even while the server is writing.
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(backup_path)
+    with target:
+        source.backup(target)
+    target.close()
+    source.close()
     print(f"✅ Database backed up to: {backup_path}")
+    return backup_path
 
 
 def show_stats():
@@ -65,7 +78,7 @@ def show_stats():
     # Get latest message
     c.execute("SELECT posted_at FROM messages ORDER BY id DESC LIMIT 1")
     latest = c.fetchone()
-    latest_msg = latest[0] if latest else "None"
+    latest_msg = bbs_server.format_timestamp(latest[0]) if latest else "None"
     
     conn.close()
     
@@ -108,11 +121,121 @@ def create_test_data():
     print("✅ Test data created successfully!")
 
 
+def search_messages(query, page=1, limit=10):
+    """Run a full-text search and print one page of ranked results."""
+    if not query:
+        print("❌ Usage: db_utils.py search \"words to find\" [--page N] [--limit N]")
+        return
+    
+    rows = bbs_server.search_messages(query, limit=limit, offset=(page - 1) * limit)
+    if not rows:
+        print(f"🔍 No matches for '{query}' on page {page}.")
+        return
+    
+    print(f"🔍 Results for '{query}' (page {page}):")
+    for message_id, author, body, posted_at in rows:
+        body = bbs_server.message_text(body)
+        print(f"   #{message_id} [{bbs_server.format_timestamp(posted_at)}] {author}: {body}")
+
+
+def rebuild_search_index():
+    """Rebuild the full-text index from the messages table."""
+    print("🔨 Rebuilding search index...")
+    bbs_server.rebuild_search_index()
+    print("✅ Search index rebuilt.")
+
+
+def compress_messages(min_bytes=None):
+    """Compress large stored message bodies and report the savings."""
+    threshold = bbs_server.COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+    print(f"🗜️  Compressing message bodies of {threshold}+ bytes...")
+    
+    rows, before, after = bbs_server.compress_existing_messages(min_bytes=threshold)
+    if not rows:
+        print("✅ Nothing to compress.")
+        return
+    
+    saved = before - after
+    print(f"✅ Compressed {rows} messages: {before:,} -> {after:,} bytes "
+          f"(saved {saved:,} bytes, {saved / before:.0%})")
+    print("   Run VACUUM (or a backup/restore) to return freed pages to the filesystem.")
+    print(STALE_CACHE_WARNING)
+
+
+def show_boards():
+    """List message boards."""
+    print("📋 Boards:")
+    for board_id, name, description in bbs_server.list_boards():
+        print(f"   [{board_id}] {name} - {description}")
+
+
+def add_board(name, description=""):
+    """Create a new message board."""
+    if not name:
+        print("❌ Usage: db_utils.py add-board NAME [--description TEXT]")
+        return
+    
+    try:
+        board_id = bbs_server.create_board(name, description)
+    except Exception as e:
+        print(f"❌ Could not create board '{name}': {e}")
+        return
+    print(f"✅ Created board [{board_id}] {name}")
+
+
+def delete_message(message_id):
+    """Delete a message and its search index entry."""
+    if not message_id.isdigit():
+        print("❌ Usage: db_utils.py delete MESSAGE_ID")
+        return
+    
+    if bbs_server.delete_message(int(message_id)):
+        print(f"✅ Deleted message #{message_id}")
+        print(STALE_CACHE_WARNING)
+    else:
+        print(f"❌ No message #{message_id}")
+
+
+def migrate_database(dry_run=False):
+    """Apply pending schema migrations (or list them with --dry-run)."""
+    current = bbs_server.get_schema_version() if Path(bbs_server.DB_PATH).exists() else 0
+    print(f"📐 Schema version: {current} (latest: {bbs_server.SCHEMA_VERSION})")
+    
+    pending = bbs_server.run_migrations(dry_run=dry_run)
+    if not pending:
+        print("✅ Schema is up to date.")
+        return
+    
+    for version, description, statements in pending:
+        print(f"   {'Would apply' if dry_run else 'Applied'} {version}: {description}")
+        if dry_run:
+            for statement in statements:
+                print("      " + " ".join(statement.split()))
+    
+    if not dry_run:
+        print(f"✅ Migrated to version {bbs_server.get_schema_version()}.")
+
+
 def main():
     """Main script entry point."""
     parser = argparse.ArgumentParser(description='BBS Database Utility')
-    parser.add_argument('command', choices=['reset', 'backup', 'stats', 'test-data'],
-                       help='Command to execute')
+    parser.add_argument('command',
+                       choices=['reset', 'backup', 'stats', 'test-data', 'search', 'fts-rebuild',
+                                'migrate', 'boards', 'add-board', 'compress', 'delete'],
+                       help="Command to execute (after compress or delete, run 'flush' "
+                            "on a running server's admin console)")
+    parser.add_argument('argument', nargs='?', default='',
+                       help='Search text (search), board name (add-board) or message id (delete)')
+    parser.add_argument('--page', type=int, default=1,
+                       help='Result page for search (default: 1)')
+    parser.add_argument('--limit', type=int, default=10,
+                       help='Results per page for search (default: 10)')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Show pending migrations without applying them')
+    parser.add_argument('--description', default='',
+                       help='Board description for add-board')
+    parser.add_argument('--min-bytes', type=int, default=None,
+                       help='Smallest body to compress (default: BBS_COMPRESS_MIN_BYTES)')
     
     args = parser.parse_args()
     
@@ -128,6 +251,20 @@ def main():
         show_stats()
     elif args.command == 'test-data':
         create_test_data()
+    elif args.command == 'search':
+        search_messages(args.argument, page=args.page, limit=args.limit)
+    elif args.command == 'fts-rebuild':
+        rebuild_search_index()
+    elif args.command == 'migrate':
+        migrate_database(dry_run=args.dry_run)
+    elif args.command == 'boards':
+        show_boards()
+    elif args.command == 'add-board':
+        add_board(args.argument, args.description)
+    elif args.command == 'compress':
+        compress_messages(args.min_bytes)
+    elif args.command == 'delete':
+        delete_message(args.argument)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Asyncio load generator for the BBS server.
+
+Each virtual user is one coroutine holding a real TCP connection: it logs in
+(registering on first run), then loops over menu actions picked from a
+weighted mix with exponential think times, and logs out when the run ends.
+Latency is measured from sending a command to seeing the next menu prompt.
+
+Usage:
+    uv run python scripts/loadgen.py --users 500 --duration 60
+    uv run python scripts/loadgen.py --users 2000 --ramp 30 --think 2 \\
+        --mix read=40,new=20,post=10,who=20,search=10 --json results.json
+"""
+import argparse
+import asyncio
+import collections
+import json
+import math
+import random
+import re
+import sys
+import time
+
+MENU_PROMPT = b"Choice?> "
+PAGER_PROMPT = b"[Q]uit: "
+# Live push notices arrive on their own and repeat the menu prompt, so they
+# are cut out before looking for prompts.
+PUSH_NOTICE = re.compile(rb"\r\n\x1b\[33m\*\*\* [^\r\n]*\x1b\[0m\r\nChoice\?> ")
+
+# action -> (menu key, prompt asking for input or None, input to send)
+ACTIONS = {
+    "read": ("1", None, None),
+    "new": ("N", None, None),
+    "who": ("3", None, None),
+    "search": ("S", b"Search for: ", "message"),
+    "post": ("2", b"editor:\r\n> ", "load test message {user} #{n}"),
+}
+
+DEFAULT_MIX = "read=40,new=20,post=10,who=20,search=10"
+
+# The server answers a post it will not store (rate limit, duplicate body)
+# with one of these instead of "Posted.".
+REFUSALS = (b"Not posted", b"Slow down")
+
+
+def parse_mix(text):
+    """'read=40,post=10' -> {'read': 40.0, 'post': 10.0}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise ValueError(f"unknown action {name!r} (choose from {', '.join(ACTIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class LoadStats:
+    """Latencies and outcome counters per action, across all virtual users."""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.refused = collections.Counter()
+        self.pushes = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, action, seconds):
+        self.latencies[action].append(seconds)
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        actions = {}
+        for action in sorted(set(self.latencies) | set(self.errors) | set(self.refused)):
+            values = sorted(self.latencies.get(action, []))
+            actions[action] = {
+                "count": len(values),
+                "errors": self.errors.get(action, 0),
+                "refused": self.refused.get(action, 0),
+                "ops_per_sec": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "elapsed_sec": round(elapsed, 2),
+            "total_ops": total,
+            "ops_per_sec": round(total / elapsed, 2) if elapsed else 0.0,
+            "push_notices": self.pushes,
+            "actions": actions,
+        }
+
+
+class VirtualUser:
+    """One scripted telnet session."""
+
+    def __init__(self, host, port, username, password, timeout):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self._buffer = b""
+        self._posts = 0
+        self.pushes = 0
+        self.reply = b""
+
+    async def expect(self, *patterns):
+        """
+        Read until one of patterns shows up; return the pattern seen first.
+        The output before it is kept in self.reply.
+        """
+        while True:
+            self._buffer, pushes = PUSH_NOTICE.subn(b"", self._buffer)
+            self.pushes += pushes
+            hits = [(self._buffer.find(p), p) for p in patterns if p in self._buffer]
+            if hits:
+                index, pattern = min(hits)
+                self.reply = self._buffer[:index]
+                self._buffer = self._buffer[index + len(pattern):]
+                return pattern
+            data = await asyncio.wait_for(self.reader.read(65536), self.timeout)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            self._buffer += data
+
+    def send(self, line):
+        self.writer.write(line.encode("utf-8") + b"\r\n")
+
+    async def login(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        await self.expect(b"Username: ")
+        self.send(self.username)
+        await self.expect(b"Create password: ", b"Password: ")
+        self.send(self.password)
+        if await self.expect(MENU_PROMPT, b"Login failed") != MENU_PROMPT:
+            raise ConnectionError(f"login failed for {self.username}")
+
+    async def run(self, action):
+        """Perform one menu action; returns False if the server refused it."""
+        key, input_prompt, payload = ACTIONS[action]
+        self.send(key)
+        if input_prompt is not None:
+            if await self.expect(input_prompt, MENU_PROMPT) == MENU_PROMPT:
+                return False  # e.g. post rate limit hit before the prompt
+            self._posts += 1
+            self.send(payload.format(user=self.username, n=self._posts))
+        reply = b""
+        while await self.expect(MENU_PROMPT, PAGER_PROMPT) == PAGER_PROMPT:
+            reply += self.reply
+            self.send("q")
+        reply += self.reply
+        return input_prompt is None or not any(refusal in reply for refusal in REFUSALS)
+
+    async def logout(self):
+        if self.writer is None:
+            return
+        try:
+            self.send("4")
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+
+async def virtual_user(index, args, mix, stats, deadline):
+    rng = random.Random(args.seed * 100003 + index if args.seed is not None else None)
+    if args.ramp > 0:
+        await asyncio.sleep(args.ramp * index / max(args.users, 1))
+    user = VirtualUser(args.host, args.port, f"{args.prefix}{index}", args.password, args.timeout)
+    actions, weights = list(mix), list(mix.values())
+    action = "login"
+    try:
+        started = time.perf_counter()
+        await user.login()
+        stats.record("login", time.perf_counter() - started)
+        while time.perf_counter() < deadline:
+            if args.think > 0:
+                await asyncio.sleep(rng.expovariate(1 / args.think))
+            action = rng.choices(actions, weights)[0]
+            started = time.perf_counter()
+            if await user.run(action):
+                stats.record(action, time.perf_counter() - started)
+            else:
+                stats.refused[action] += 1
+    except (OSError, asyncio.TimeoutError, ConnectionError):
+        stats.errors[action] += 1
+    finally:
+        stats.pushes += user.pushes
+        await user.logout()
+
+
+async def run_load(args, mix):
+    stats = LoadStats()
+    deadline = time.perf_counter() + args.ramp + args.duration
+    await asyncio.gather(*(virtual_user(i, args, mix, stats, deadline) for i in range(args.users)))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+def print_report(summary):
+    print(f"{'action':<8} {'count':>8} {'errors':>7} {'refused':>8} {'ops/s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action, row in summary["actions"].items():
+        print(f"{action:<8} {row['count']:>8} {row['errors']:>7} {row['refused']:>8} "
+              f"{row['ops_per_sec']:>9} {row['p50_ms']:>9} {row['p95_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['max_ms']:>9}")
+    print(f"\n{summary['total_ops']} operations in {summary['elapsed_sec']}s "
+          f"({summary['ops_per_sec']} ops/s), {summary['push_notices']} push notices received")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="BBS load generator")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=2323, help="Server port (default: 2323)")
+    parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users (default: 50)")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="Seconds each user keeps running actions after the ramp (default: 30)")
+    parser.add_argument("--ramp", type=float, default=0,
+                        help="Seconds over which users connect, evenly spaced (default: 0)")
+    parser.add_argument("--think", type=float, default=1.0,
+                        help="Mean think time between actions in seconds, exponential (default: 1)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted action mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--prefix", default="load", help="Username prefix (default: load)")
+    parser.add_argument("--password", default="loadpass", help="Password for every virtual user")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-response timeout in seconds (default: 30)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable runs")
+    parser.add_argument("--json", default=None, help="Also write the summary to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+
+    print(f"🚀 {args.users} users against {args.host}:{args.port} for {args.duration:g}s "
+          f"(ramp {args.ramp:g}s, think {args.think:g}s)")
+    summary = asyncio.run(run_load(args, mix)).summary()
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"✅ Summary written to {args.json}")
+    return 1 if any(row["errors"] for row in summary["actions"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
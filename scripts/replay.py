@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Replay recorded session transcripts against a BBS server.
+
+Transcripts come from the server's session recorder (BBS_RECORD_SESSIONS=1
+or the admin console's "record" command). Every recorded session is
+reopened at its original offset from the start of the recording and sends
+its lines with the original gaps, divided by --speed. A line is never sent
+before the server has answered the previous one with a prompt, so each
+session's input stays in the order the server saw it, and the time from a
+line to the next prompt is reported per menu action.
+
+Passwords were not recorded; every session logs in with --password, so
+replay against a fresh database (or use --prefix to rename the users).
+
+Usage:
+    uv run python scripts/replay.py data/transcripts/sessions-*.jsonl
+    uv run python scripts/replay.py sessions.jsonl --speed 10 --port 2424 --json replay.json
+    uv run python scripts/replay.py sessions.jsonl --speed 0     # no think time at all
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bbs_server import MENU_ACTIONS, SessionRecorder
+from scripts import loadgen
+
+# Every prompt the server waits at, matched at the very end of its output.
+# Message text can end in ": " or "> " too, so only these count.
+PROMPTS = re.compile(
+    rb"(?:Username: |assword: |Choice\?> |\[Q\]uit: |Search for: |"
+    rb"editor:\r\n> |(?:\A|\n) *\d+> |\nnew> |\(Enter to keep current\): |"
+    rb"Thread of message #: |Reply to # \(Enter to return\): |(?:\A|\n)To: )\Z"
+)
+
+
+def load_transcripts(paths):
+    """Sessions from one or more transcript files, ordered by start offset."""
+    sessions = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != SessionRecorder.FORMAT:
+                raise ValueError(f"{path}: not a session transcript")
+            if header.get("version") != SessionRecorder.VERSION:
+                raise ValueError(f"{path}: unsupported transcript version {header.get('version')}")
+            entries = (json.loads(line) for line in f if line.strip())
+            # A recording restarted within the same second appends another header.
+            sessions.extend(entry for entry in entries if "lines" in entry)
+    sessions.sort(key=lambda session: session["at"])
+    return sessions
+
+
+def rename_users(sessions, prefix):
+    """Give each distinct username (a session's first line) a prefix+number alias."""
+    names = {}
+    for session in sessions:
+        if session["lines"] and session["lines"][0][1] is not None:
+            original = session["lines"][0][1]
+            session["lines"][0][1] = names.setdefault(original, f"{prefix}{len(names)}")
+    return names
+
+
+def action_for(prompt, line):
+    """Name the step a line answers, for the report."""
+    if prompt.endswith(b"Choice?> "):
+        return MENU_ACTIONS.get(line.lower(), "invalid")
+    if prompt.endswith(b"Username: "):
+        return "username"
+    if prompt.endswith(b"assword: "):
+        return "password"
+    return "input"
+
+
+class ReplaySession:
+    """One recorded session played back over its own connection."""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self._buffer = b""
+
+    async def prompt(self):
+        """Read until the output ends at a prompt; returns the prompt's line."""
+        while True:
+            self._buffer = loadgen.PUSH_NOTICE.sub(b"", self._buffer)
+            if PROMPTS.search(self._buffer):
+                prompt = self._buffer.rsplit(b"\n", 1)[-1]
+                self._buffer = b""
+                return prompt
+            data = await asyncio.wait_for(self.reader.read(65536), self.timeout)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            self._buffer += data
+
+    async def play(self, lines, password, speed, stats):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        try:
+            prompt = await self.prompt()
+            due = time.perf_counter()
+            for number, (delay_ms, line) in enumerate(lines, 1):
+                if speed > 0:
+                    due += delay_ms / 1000 / speed
+                    await asyncio.sleep(max(due - time.perf_counter(), 0))
+                text = password if line is None else line
+                action = action_for(prompt, text)
+                started = time.perf_counter()
+                self.writer.write(text.encode("utf-8") + b"\r\n")
+                try:
+                    prompt = await self.prompt()
+                except ConnectionError:
+                    if number == len(lines):
+                        break  # logged out, or the recording ended at a closing line
+                    raise
+                stats.record(action, time.perf_counter() - started)
+        finally:
+            self.writer.close()
+
+
+async def replay_session(session, args, stats, started):
+    if args.speed > 0:
+        await asyncio.sleep(max(started + session["at"] / 1000 / args.speed - time.perf_counter(), 0))
+    player = ReplaySession(args.host, args.port, args.timeout)
+    try:
+        await player.play(session["lines"], args.password, args.speed, stats)
+    except (OSError, asyncio.TimeoutError, ConnectionError):
+        stats.errors["session"] += 1
+
+
+async def run_replay(args, sessions):
+    stats = loadgen.LoadStats()
+    await asyncio.gather(*(replay_session(session, args, stats, stats.started) for session in sessions))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded BBS sessions")
+    parser.add_argument("transcripts", nargs="+", help="Transcript files written by the session recorder")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=2323, help="Server port (default: 2323)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Playback speed; 10 is ten times faster, 0 drops all waiting (default: 1)")
+    parser.add_argument("--password", default="replaypass", help="Password sent where one was recorded")
+    parser.add_argument("--prefix", default=None, help="Replace recorded usernames with prefix0, prefix1, ...")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N sessions")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-response timeout in seconds (default: 30)")
+    parser.add_argument("--json", default=None, help="Also write the summary to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    try:
+        sessions = load_transcripts(args.transcripts)[:args.limit]
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+    if args.prefix:
+        rename_users(sessions, args.prefix)
+
+    recorded = max((s["at"] + sum(delay for delay, _ in s["lines"]) for s in sessions), default=0) / 1000
+    print(f"▶️  Replaying {len(sessions)} sessions ({recorded:.1f}s recorded) against "
+          f"{args.host}:{args.port} at {'full speed' if args.speed <= 0 else f'{args.speed:g}x'}")
+    stats = asyncio.run(run_replay(args, sessions))
+    summary = stats.summary()
+    summary["sessions"] = len(sessions)
+    summary["failed_sessions"] = stats.errors["session"]
+    loadgen.print_report(summary)
+    if summary["failed_sessions"]:
+        print(f"❌ {summary['failed_sessions']} of {len(sessions)} sessions failed")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"✅ Summary written to {args.json}")
+    return 1 if summary["failed_sessions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
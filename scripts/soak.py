@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Soak test: run the server in-process under connect/disconnect churn and
+watch its memory for growth that only shows up over long uptimes.
+
+Virtual users log in, run a few menu actions and leave, some politely and
+some by dropping the connection, over and over for the whole run. Every
+interval the script samples RSS, tracemalloc's traced total and the size of
+the server's in-memory state (ACTIVE_USERS, SESSIONS, push subscribers,
+flood-control and read-mark state, caches, tasks, stream buffers). At the
+end it reports the allocation sites that grew most since warmup and exits 1
+when state outlives its sessions or traced memory grew past the limit.
+
+Usage:
+    uv run python scripts/soak.py --duration 3600 --users 50 --interval 60
+    uv run python scripts/soak.py --duration 86400 --users 200 --json soak.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import bbs_server
+from scripts import loadgen
+
+# State that belongs to sessions and must be empty once every session is gone.
+PER_SESSION_STATE = ("active_users", "sessions", "push_subscribers")
+
+# Frames tracemalloc keeps per allocation; more frames, better attribution, more overhead.
+DEFAULT_FRAMES = 5
+
+
+def rss_bytes():
+    """Current resident set size, or the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def stream_buffer_bytes(session):
+    """Bytes held for one session: unread input, partial telnet commands, unsent output."""
+    reader = session.reader
+    return len(reader._reader._buffer) + len(reader._sb) + session.buffered_bytes()
+
+
+def state_sizes():
+    """Entry counts of the server's long-lived in-memory structures."""
+    return {
+        "active_users": len(bbs_server.ACTIVE_USERS),
+        "sessions": len(bbs_server.SESSIONS),
+        "push_subscribers": len(bbs_server.HUB),
+        "stream_buffers": sum(stream_buffer_bytes(session) for session in bbs_server.SESSIONS.values()),
+        "post_guard_users": bbs_server.POST_GUARD.stats()["tracked_users"],
+        "pending_read_marks": len(bbs_server.PENDING_READ_MARKS),
+        "message_cache": len(bbs_server.MESSAGE_LINE_CACHE),
+        "wrap_cache": len(bbs_server.WRAP_CACHE),
+        "screen_cache": len(bbs_server.SCREEN_CACHE),
+        "board_cache": len(bbs_server.BOARD_LATEST_CACHE),
+        "tasks": len(asyncio.all_tasks()),
+    }
+
+
+def take_sample(started):
+    traced, _ = tracemalloc.get_traced_memory()
+    return {
+        "elapsed_sec": round(time.perf_counter() - started, 1),
+        "rss_bytes": rss_bytes(),
+        "traced_bytes": traced,
+        "state": state_sizes(),
+    }
+
+
+def growth_per_hour(samples):
+    """Least-squares slope of traced memory, in bytes per hour."""
+    if len(samples) < 2:
+        return 0.0
+    xs = [s["elapsed_sec"] for s in samples]
+    ys = [s["traced_bytes"] for s in samples]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread * 3600
+
+
+def growth_sites(before, after, limit=10):
+    """The allocation sites whose live size grew most between two snapshots."""
+    ignore = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ]
+    diffs = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "traceback")
+    sites = []
+    for diff in diffs:
+        if diff.size_diff <= 0:
+            continue
+        frames = [f"{frame.filename}:{frame.lineno}" for frame in diff.traceback]
+        sites.append({
+            "site": frames[-1],
+            "traceback": frames,
+            "size_diff": diff.size_diff,
+            "count_diff": diff.count_diff,
+        })
+        if len(sites) == limit:
+            break
+    return sites
+
+
+def leak_findings(idle_state, final_state, traced_growth, max_growth):
+    """
+    Describe every sign of a leak: per-session state left behind after all
+    sessions closed, tasks that outlived them, or traced memory growing past
+    max_growth bytes since warmup.
+    """
+    findings = []
+    for name in PER_SESSION_STATE:
+        if final_state[name]:
+            findings.append(f"{name} still holds {final_state[name]} after every session closed")
+    if final_state["tasks"] > idle_state["tasks"]:
+        findings.append(f"{final_state['tasks'] - idle_state['tasks']} task(s) outlived their sessions")
+    if traced_growth > max_growth:
+        findings.append(f"traced memory grew {traced_growth / 2**20:.1f}MB since warmup "
+                        f"(limit {max_growth / 2**20:.1f}MB)")
+    return findings
+
+
+async def churn_user(index, args, mix, deadline, stats):
+    """Connect, run a few actions, disconnect; repeat until the deadline."""
+    rng = random.Random(args.seed * 100003 + index if args.seed is not None else None)
+    actions, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        user = loadgen.VirtualUser(args.host, args.port, f"{args.prefix}{index}", args.password, args.timeout)
+        try:
+            await user.login()
+            for _ in range(rng.randint(1, args.actions)):
+                if args.think > 0:
+                    await asyncio.sleep(rng.expovariate(1 / args.think))
+                await user.run(rng.choices(actions, weights)[0])
+            if rng.random() < args.abrupt:
+                # Vanish mid-session, the way dropped links do.
+                user.writer.transport.abort()
+                stats["aborted"] += 1
+            else:
+                await user.logout()
+            stats["sessions"] += 1
+        except (OSError, asyncio.TimeoutError, ConnectionError):
+            stats["errors"] += 1
+            if user.writer is not None:
+                user.writer.close()
+        await asyncio.sleep(rng.uniform(0, args.think))
+
+
+async def wait_for_sessions_to_close(timeout):
+    """Give server-side session tasks time to run their cleanup."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if not any(state_sizes()[name] for name in PER_SESSION_STATE):
+            break
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(0.2)
+
+
+def print_sample(sample):
+    state = sample["state"]
+    print(f"⏱  {sample['elapsed_sec']:>8.1f}s  rss {sample['rss_bytes'] / 2**20:7.1f}MB  "
+          f"traced {sample['traced_bytes'] / 2**20:6.1f}MB  sessions {state['sessions']:>4}  "
+          f"active {state['active_users']:>4}  subs {state['push_subscribers']:>4}  "
+          f"tasks {state['tasks']:>4}  caches {state['message_cache']}/{state['wrap_cache']}/"
+          f"{state['screen_cache']}", flush=True)
+
+
+async def run_soak(args, mix, on_sample=None):
+    """
+    Run the server and churning users for args.duration seconds. Returns the
+    report: samples, top growth sites, traced growth rate and findings.
+    """
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(args.frames)
+    server = await asyncio.start_server(
+        bbs_server.session_task, host=args.host, port=args.port or 0, limit=bbs_server.MAX_LINE_BYTES
+    )
+    args.port = server.sockets[0].getsockname()[1]
+    flusher = asyncio.create_task(bbs_server.read_mark_flusher())
+    idle_state = state_sizes()
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    stats = {"sessions": 0, "aborted": 0, "errors": 0}
+    users = [asyncio.create_task(churn_user(i, args, mix, deadline, stats)) for i in range(args.users)]
+
+    samples, baseline = [], None
+    try:
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(min(args.interval, max(deadline - time.perf_counter(), 0)))
+            sample = take_sample(started)
+            samples.append(sample)
+            if on_sample is not None:
+                on_sample(sample)
+            if baseline is None and sample["elapsed_sec"] >= args.warmup:
+                # Caches legitimately fill during warmup; growth counts from here.
+                gc.collect()
+                baseline = (sample, tracemalloc.take_snapshot())
+        await asyncio.gather(*users)
+    finally:
+        for task in users:
+            task.cancel()
+        await wait_for_sessions_to_close(args.timeout)
+        server.close()
+        await server.wait_closed()
+
+    gc.collect()
+    final = take_sample(started)
+    flusher.cancel()
+    if baseline is None:
+        baseline = (samples[0] if samples else final, tracemalloc.take_snapshot())
+    sites = growth_sites(baseline[1], tracemalloc.take_snapshot(), args.top)
+    if started_tracing:
+        tracemalloc.stop()
+
+    after_warmup = [s for s in samples if s["elapsed_sec"] >= baseline[0]["elapsed_sec"]]
+    traced_growth = final["traced_bytes"] - baseline[0]["traced_bytes"]
+    return {
+        "duration_sec": args.duration,
+        "users": args.users,
+        "sessions": stats["sessions"],
+        "aborted": stats["aborted"],
+        "errors": stats["errors"],
+        "samples": samples,
+        "final": final,
+        "rss_growth_bytes": final["rss_bytes"] - baseline[0]["rss_bytes"],
+        "traced_growth_bytes": traced_growth,
+        "traced_growth_per_hour_bytes": round(growth_per_hour(after_warmup)),
+        "top_growth": sites,
+        "findings": leak_findings(idle_state, final["state"], traced_growth, args.max_growth_mb * 2**20),
+    }
+
+
+def print_report(report):
+    print(f"\n🔁 {report['sessions']} sessions ({report['aborted']} dropped abruptly), "
+          f"{report['errors']} errors over {report['duration_sec']:g}s")
+    print(f"📈 traced {report['traced_growth_bytes'] / 2**20:+.2f}MB since warmup "
+          f"({report['traced_growth_per_hour_bytes'] / 2**20:+.2f}MB/hour), "
+          f"rss {report['rss_growth_bytes'] / 2**20:+.2f}MB")
+    print("\nTop allocation growth since warmup:")
+    for site in report["top_growth"]:
+        print(f"  {site['size_diff'] / 1024:>+10.1f}KB {site['count_diff']:>+7} blocks  {site['site']}")
+    if not report["top_growth"]:
+        print("  (none)")
+    if report["findings"]:
+        print(f"\n❌ {len(report['findings'])} possible leak(s):")
+        for line in report["findings"]:
+            print(f"  - {line}")
+    else:
+        print("\n✅ No session state left behind and no growth past the limit.")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="BBS soak test with memory growth detection")
+    parser.add_argument("--duration", type=float, default=600, help="Seconds to run (default: 600)")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent churning users (default: 20)")
+    parser.add_argument("--actions", type=int, default=5,
+                        help="Most menu actions per session before leaving (default: 5)")
+    parser.add_argument("--think", type=float, default=0.5,
+                        help="Mean think time between actions in seconds (default: 0.5)")
+    parser.add_argument("--abrupt", type=float, default=0.2,
+                        help="Share of sessions that drop the connection instead of logging out (default: 0.2)")
+    parser.add_argument("--mix", default=loadgen.DEFAULT_MIX, help=f"Weighted action mix (default: {loadgen.DEFAULT_MIX})")
+    parser.add_argument("--interval", type=float, default=30, help="Seconds between samples (default: 30)")
+    parser.add_argument("--warmup", type=float, default=60,
+                        help="Seconds before the growth baseline is taken (default: 60)")
+    parser.add_argument("--max-growth-mb", type=float, default=10,
+                        help="Traced memory growth since warmup that fails the run (default: 10)")
+    parser.add_argument("--top", type=int, default=10, help="Growth sites to report (default: 10)")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES,
+                        help=f"Stack frames tracemalloc keeps per allocation (default: {DEFAULT_FRAMES})")
+    parser.add_argument("--host", default="127.0.0.1", help="Address the in-process server binds (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=0, help="Port the in-process server binds (default: any free port)")
+    parser.add_argument("--db-path", default=None, help="Database to use (default: a fresh temporary one)")
+    parser.add_argument("--prefix", default="soak", help="Username prefix (default: soak)")
+    parser.add_argument("--password", default="soakpass", help="Password for every virtual user")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-response timeout in seconds (default: 30)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable runs")
+    parser.add_argument("--log-level", default="WARNING", help="Server log level (default: WARNING)")
+    parser.add_argument("--json", default=None, help="Also write the report to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    try:
+        mix = loadgen.parse_mix(args.mix)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+
+    temp_dir = None
+    if args.db_path is None:
+        temp_dir = tempfile.mkdtemp(prefix="bbs-soak-")
+        args.db_path = os.path.join(temp_dir, "soak.sqlite3")
+    bbs_server.DB_PATH = args.db_path
+    bbs_server.init_db()
+    listener = bbs_server.setup_logging(args.log_level, sys.stderr)
+
+    print(f"🧪 Soaking {args.users} users for {args.duration:g}s "
+          f"(sample every {args.interval:g}s, warmup {args.warmup:g}s, db {args.db_path})")
+    try:
+        report = asyncio.run(run_soak(args, mix, on_sample=print_sample))
+    finally:
+        listener.stop()
+        if temp_dir is not None:
+            for name in os.listdir(temp_dir):
+                os.remove(os.path.join(temp_dir, name))
+            os.rmdir(temp_dir)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.json}")
+    return 1 if report["findings"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,6 +33,7 @@ def temp_db():
     
     # Initialize the test database
     bbs_server.init_db()
+    bbs_server.clear_caches()
     
     yield db_path
     
@@ -109,4 +109,307 @@ class TestDatabase:
         
         # Test higher limit
         messages = bbs_server.list_messages(limit=20)
-        assert len(messages) == 15  # Only 15 messages exist
\ No newline at end of file
+        assert len(messages) == 15  # Only 15 messages exist
+    
+    def test_keyset_pagination(self, temp_db):
+        """Test walking older and newer pages by message id."""
+        for i in range(25):
+            bbs_server.post_message("pager", f"Message {i}")
+        
+        first = bbs_server.list_messages_before(None, limit=10)
+        assert [row[2] for row in first] == [f"Message {i}" for i in range(24, 14, -1)]
+        
+        second = bbs_server.list_messages_before(first[-1][0], limit=10)
+        assert [row[2] for row in second] == [f"Message {i}" for i in range(14, 4, -1)]
+        
+        last = bbs_server.list_messages_before(second[-1][0], limit=10)
+        assert [row[2] for row in last] == [f"Message {i}" for i in range(4, -1, -1)]
+        
+        # Paging back towards newer messages returns the adjacent page, newest first
+        back = bbs_server.list_messages_after(last[0][0], limit=10)
+        assert back == second
+        assert bbs_server.list_messages_after(first[0][0], limit=10) == []
+    
+    def test_read_marks_are_batched(self, temp_db, monkeypatch):
+        """Test the per-user high-water mark and its batched writes."""
+        bbs_server.PENDING_READ_MARKS.clear()
+        monkeypatch.setattr(bbs_server, "READ_MARK_BATCH", 2)
+        ids = [bbs_server.post_message("author", f"Message {i}") for i in range(5)]
+        
+        assert bbs_server.get_last_read_id("reader") == 0
+        assert [row[0] for row in bbs_server.list_messages_since(0, limit=10)] == ids
+        
+        # Marks only move forward and stay in memory until the batch fills
+        bbs_server.mark_read("reader", ids[2])
+        bbs_server.mark_read("reader", ids[1])
+        assert bbs_server.get_last_read_id("reader") == ids[2]
+        conn = sqlite3.connect(temp_db)
+        assert conn.execute("SELECT COUNT(*) FROM read_marks").fetchone()[0] == 0
+        
+        bbs_server.mark_read("other", ids[0])
+        assert bbs_server.PENDING_READ_MARKS == {}
+        assert conn.execute(
+            "SELECT last_read_id FROM read_marks WHERE username = 'reader'"
+        ).fetchone()[0] == ids[2]
+        conn.close()
+        
+        unread = bbs_server.list_messages_since(bbs_server.get_last_read_id("reader"), limit=10)
+        assert [row[2] for row in unread] == ["Message 3", "Message 4"]
+    
+    def test_full_text_search(self, temp_db):
+        """Test FTS5 search ranking, paging and trigger sync."""
+        bbs_server.post_message("alice", "The quick brown fox")
+        bbs_server.post_message("bob", "A lazy dog sleeps")
+        bbs_server.post_message("carol", "fox fox fox everywhere")
+        
+        results = bbs_server.search_messages("fox")
+        assert [row[1] for row in results] == ["carol", "alice"]
+        assert bbs_server.search_messages("fox", limit=1, offset=1)[0][1] == "alice"
+        assert bbs_server.search_messages("quick fox")[0][1] == "alice"
+        assert bbs_server.search_messages("elephant") == []
+        
+        # Quoting keeps FTS5 operators in user input from raising errors
+        assert bbs_server.search_messages('fox" OR (') == []
+        
+        # Deletes are mirrored into the index by trigger
+        conn = sqlite3.connect(temp_db)
+        conn.execute("DELETE FROM messages WHERE author = 'carol'")
+        conn.commit()
+        conn.close()
+        assert [row[1] for row in bbs_server.search_messages("fox")] == ["alice"]
+    
+    def test_search_index_backfills_existing_database(self, temp_db):
+        """Test that a pre-search database gets its messages indexed."""
+        conn = sqlite3.connect(temp_db)
+        for trigger in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au"):
+            conn.execute(f"DROP TRIGGER {trigger}")
+        conn.execute("DROP TABLE messages_fts")
+        conn.execute("PRAGMA user_version = 0")
+        conn.execute(
+            "INSERT INTO messages (author, body, posted_at) VALUES ('old', 'legacy post', 'x')"
+        )
+        conn.commit()
+        conn.close()
+        
+        bbs_server.init_db()
+        assert [row[2] for row in bbs_server.search_messages("legacy")] == ["legacy post"]
+        
+        bbs_server.rebuild_search_index()
+        assert len(bbs_server.search_messages("legacy")) == 1
+    
+    def test_migrations_set_schema_version(self, temp_db):
+        """Test that init_db applies every migration and records the version."""
+        assert bbs_server.get_schema_version() == bbs_server.SCHEMA_VERSION
+        assert bbs_server.run_migrations() == []
+        
+        conn = sqlite3.connect(temp_db)
+        indexes = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        )}
+        conn.close()
+        assert "idx_messages_author" in indexes
+        assert "idx_messages_posted_at" in indexes
+    
+    def test_migrations_upgrade_unversioned_database(self, tmp_path):
+        """Test dry-run and upgrade of a database created before versioning."""
+        db_path = str(tmp_path / "legacy.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "CREATE TABLE users (username TEXT PRIMARY KEY, password_hash BLOB NOT NULL, created_at TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, author TEXT NOT NULL, "
+            "body TEXT NOT NULL, posted_at TEXT NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO messages (author, body, posted_at) "
+            "VALUES ('old', 'kept', '2024-01-02T03:04:05.678000')"
+        )
+        conn.commit()
+        conn.close()
+        
+        planned = bbs_server.run_migrations(db_path, dry_run=True)
+        assert [m[0] for m in planned] == [m[0] for m in bbs_server.MIGRATIONS]
+        assert bbs_server.get_schema_version(db_path) == 0
+        
+        applied = bbs_server.run_migrations(db_path)
+        assert applied == planned
+        assert bbs_server.get_schema_version(db_path) == bbs_server.SCHEMA_VERSION
+        
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT body, posted_at FROM messages").fetchall() == [
+            ("kept", 1704164645678)
+        ]
+        conn.close()
+    
+    def test_timestamps_are_epoch_milliseconds(self, temp_db):
+        """Test that timestamps are stored as integers and formatted on render."""
+        before = bbs_server.now_ms()
+        message_id = bbs_server.post_message("author", "timed")
+        
+        conn = sqlite3.connect(temp_db)
+        posted_at, kind = conn.execute(
+            "SELECT posted_at, typeof(posted_at) FROM messages WHERE id = ?", (message_id,)
+        ).fetchone()
+        conn.close()
+        assert kind == "integer"
+        assert before <= posted_at <= bbs_server.now_ms()
+        
+        assert bbs_server.format_timestamp(1704164645678) == "2024-01-02 03:04:05"
+        line = bbs_server.render_message(message_id, "author", "timed", posted_at)
+        assert line.endswith("] author: timed\r\n")
+        assert bbs_server.MESSAGE_LINE_CACHE.get(message_id) == line
+    
+    def test_boards_isolate_messages(self, temp_db):
+        """Test that messages, paging and read marks are scoped per board."""
+        assert bbs_server.list_boards()[0][:2] == (1, "general")
+        tech = bbs_server.create_board("tech", "Computers")
+        assert bbs_server.get_board("tech")[0] == tech
+        assert bbs_server.get_board(str(tech))[1] == "tech"
+        assert bbs_server.get_board("missing") is None
+        
+        general_id = bbs_server.post_message("alice", "general chatter")
+        tech_id = bbs_server.post_message("bob", "tech talk", board_id=tech)
+        
+        assert [row[1] for row in bbs_server.list_messages()] == ["general chatter"]
+        assert [row[0] for row in bbs_server.list_messages_before(None, board_id=tech)] == [tech_id]
+        assert bbs_server.list_messages_since(0, board_id=tech)[0][0] == tech_id
+        
+        bbs_server.mark_read("carol", tech_id, board_id=tech)
+        bbs_server.flush_read_marks()
+        assert bbs_server.get_last_read_id("carol", board_id=tech) == tech_id
+        assert bbs_server.get_last_read_id("carol") == 0
+        assert bbs_server.list_messages_since(0)[0][0] == general_id
+    
+    def test_latest_cache_per_board(self, temp_db):
+        """Test that the per-board latest cache tracks posts without cross-talk."""
+        tech = bbs_server.create_board("tech")
+        bbs_server.post_message("alice", "before cache")
+        
+        assert [row[2] for row in bbs_server.latest_messages(limit=5)] == ["before cache"]
+        assert bbs_server.latest_messages(tech, limit=5) == []
+        
+        # New posts are folded into the cached feed of their own board only
+        bbs_server.post_message("bob", "after cache")
+        bbs_server.post_message("carol", "tech only", board_id=tech)
+        assert [row[2] for row in bbs_server.latest_messages(limit=5)] == ["after cache", "before cache"]
+        assert [row[2] for row in bbs_server.latest_messages(tech, limit=5)] == ["tech only"]
+        assert bbs_server.latest_messages(limit=5) == bbs_server.list_messages_before(None, 5)
+    
+    def test_threaded_replies(self, temp_db):
+        """Test thread ids, depth-first ordering and incremental reply counts."""
+        root = bbs_server.post_message("alice", "root post")
+        other = bbs_server.post_message("bob", "unrelated")
+        first = bbs_server.post_message("bob", "first reply", parent_id=root)
+        nested = bbs_server.post_message("carol", "nested reply", parent_id=first)
+        second = bbs_server.post_message("dave", "second reply", parent_id=root)
+        
+        assert bbs_server.get_message(nested)[2] == root
+        assert bbs_server.get_message(other)[2] == other
+        
+        thread = bbs_server.get_thread(root)
+        assert [(row[0], row[4]) for row in thread] == [
+            (root, 0), (first, 1), (nested, 2), (second, 1)
+        ]
+        assert thread[0][5] == 3
+        assert bbs_server.get_thread(other)[0][5] == 0
+        
+        # Thread bookkeeping must not churn the full-text index
+        assert [row[0] for row in bbs_server.search_messages("root")] == [root]
+        assert len(bbs_server.search_messages("reply")) == 3
+    
+    def test_private_mailbox_counters(self, temp_db):
+        """Test that the unread counter tracks sends and reads."""
+        assert bbs_server.get_mailbox_counts("bob") == (0, 0)
+        
+        first = bbs_server.send_private_message("alice", "bob", "hi bob")
+        second = bbs_server.send_private_message("carol", "bob", "hey")
+        bbs_server.send_private_message("bob", "alice", "reply")
+        assert bbs_server.get_mailbox_counts("bob") == (2, 2)
+        
+        inbox = bbs_server.list_mailbox("bob")
+        assert [row[0] for row in inbox] == [second, first]
+        assert bbs_server.list_mailbox("bob", before_id=second) == inbox[1:]
+        
+        assert bbs_server.mark_mailbox_read("bob", [first]) == 1
+        assert bbs_server.mark_mailbox_read("bob", [first]) == 0
+        assert bbs_server.get_mailbox_counts("bob") == (1, 2)
+        assert bbs_server.get_mailbox_counts("alice") == (1, 1)
+    
+    def test_large_bodies_are_compressed(self, temp_db, monkeypatch):
+        """Test transparent compression of large bodies on the read and search paths."""
+        monkeypatch.setattr(bbs_server, "COMPRESS_MIN_BYTES", 100)
+        big = "compressible words repeated " * 20
+        small_id = bbs_server.post_message("alice", "short body")
+        big_id = bbs_server.post_message("bob", big)
+        
+        conn = sqlite3.connect(temp_db)
+        stored = dict(conn.execute("SELECT id, compressed FROM messages").fetchall())
+        conn.close()
+        assert stored == {small_id: 0, big_id: 1}
+        
+        rows = bbs_server.list_messages_before(None)
+        assert isinstance(rows[0][2], bytes)
+        assert bbs_server.message_text(rows[0][2]) == big
+        assert bbs_server.list_messages()[0][1] == big
+        assert big in bbs_server.render_message(*rows[0])
+        assert [row[0] for row in bbs_server.search_messages("compressible")] == [big_id]
+        
+        # Rebuilding the index restores the plain text of compressed rows
+        bbs_server.rebuild_search_index()
+        assert [row[0] for row in bbs_server.search_messages("compressible")] == [big_id]
+        assert [row[0] for row in bbs_server.search_messages("short")] == [small_id]
+    
+    def test_delete_compressed_message(self, temp_db, monkeypatch):
+        """Test that deleting a message removes its search entry, compressed or not."""
+        monkeypatch.setattr(bbs_server, "COMPRESS_MIN_BYTES", 100)
+        root_id = bbs_server.post_message("alice", "zebra root " * 30)
+        reply_id = bbs_server.post_message("bob", "zebra reply", parent_id=root_id)
+        assert bbs_server.get_message(root_id) is not None
+        
+        assert bbs_server.delete_message(root_id) is True
+        assert bbs_server.delete_message(root_id) is False
+        assert [row[0] for row in bbs_server.search_messages("zebra")] == [reply_id]
+        
+        conn = sqlite3.connect(temp_db)
+        indexed = conn.execute(
+            "SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'zebra'"
+        ).fetchall()
+        assert indexed == [(reply_id,)]
+        conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('integrity-check')")  # raises if corrupt
+        conn.close()
+    
+    def test_compress_existing_messages(self, temp_db, monkeypatch):
+        """Test compressing rows written before compression was enabled."""
+        monkeypatch.setattr(bbs_server, "COMPRESS_MIN_BYTES", 10 ** 9)
+        big = "legacy text that compresses well " * 30
+        big_id = bbs_server.post_message("alice", big)
+        bbs_server.post_message("bob", "tiny")
+        
+        rows, before, after = bbs_server.compress_existing_messages(min_bytes=100, batch_size=1)
+        assert rows == 1
+        assert before == len(big.encode("utf-8"))
+        assert 0 < after < before
+        assert bbs_server.compress_existing_messages(min_bytes=100) == (0, 0, 0)
+        
+        assert bbs_server.message_text(bbs_server.get_message(big_id)[4]) == big
+        assert [row[0] for row in bbs_server.search_messages("legacy")] == [big_id]
+    
+    def test_backup_includes_uncheckpointed_commits(self, temp_db):
+        """Test that backups taken in WAL mode contain commits still in the -wal file."""
+        from scripts import db_utils
+        
+        reader = sqlite3.connect(temp_db)
+        reader.execute("SELECT 1 FROM messages").fetchall()  # an open reader blocks auto-checkpoints
+        message_id = bbs_server.post_message("alice", "only in the wal so far")
+        
+        backup_path = db_utils.backup_database()
+        reader.close()
+        try:
+            conn = sqlite3.connect(backup_path)
+            assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+            row = conn.execute("SELECT author FROM messages WHERE id = ?", (message_id,)).fetchone()
+            conn.close()
+            assert row == ("alice",)
+        finally:
+            Path(backup_path).unlink()
@@ -191,4 +191,220 @@ class TestPerformance:
         assert long_message in response
         assert long_username in response
         
-        bbs_client.logout()
\ No newline at end of file
+        bbs_client.logout()
+
+class TestLoadGenerator:
+    """Test the asyncio load generator against an in-process server."""
+    
+    def test_mix_and_percentiles(self):
+        """Mix strings parse to weights; percentiles use nearest rank; refusals are reported."""
+        from scripts import loadgen
+        
+        assert loadgen.parse_mix("read=3,post") == {"read": 3.0, "post": 1.0}
+        with pytest.raises(ValueError):
+            loadgen.parse_mix("dance=1")
+        values = [i / 100 for i in range(1, 101)]
+        assert loadgen.percentile(values, 50) == 0.5
+        assert loadgen.percentile(values, 99) == 0.99
+        assert loadgen.percentile([], 95) == 0.0
+        
+        stats = loadgen.LoadStats()
+        stats.refused["post"] += 3
+        assert stats.summary()["actions"]["post"]["refused"] == 3
+    
+    @pytest.mark.asyncio
+    @pytest.mark.timeout(30)
+    async def test_short_run_covers_every_action(self, bbs_server_instance, temp_db):
+        """A short run logs in every user and runs each action without errors."""
+        from scripts import loadgen
+        
+        args = loadgen.parse_arguments([
+            "--port", str(bbs_server_instance), "--users", "3", "--duration", "1.5",
+            "--think", "0.01", "--seed", "7", "--timeout", "10",
+        ])
+        summary = (await loadgen.run_load(args, loadgen.parse_mix(args.mix))).summary()
+        actions = summary["actions"]
+        
+        assert actions["login"]["count"] == 3
+        assert set(actions) == {"login", "read", "new", "post", "who", "search"}
+        assert all(row["errors"] == 0 for row in actions.values())
+        assert all(row["p50_ms"] <= row["p95_ms"] <= row["p99_ms"] <= row["max_ms"]
+                   for row in actions.values())
+    
+    @pytest.mark.asyncio
+    @pytest.mark.timeout(30)
+    async def test_refused_post_is_not_a_post(self, bbs_server_instance, temp_db, monkeypatch):
+        """A body the server answers with "Not posted" counts as refused."""
+        from scripts import loadgen
+        
+        monkeypatch.setitem(loadgen.ACTIONS, "post", ("2", b"editor:\r\n> ", "same body every time"))
+        user = loadgen.VirtualUser("127.0.0.1", bbs_server_instance, "refused0", "loadpass", 10)
+        await user.login()
+        try:
+            assert await user.run("post") is True
+            assert await user.run("post") is False
+            assert await user.run("read") is True
+        finally:
+            await user.logout()
+
+class TestStorageBenchmarks:
+    """Test the storage micro-benchmark script and its regression gate."""
+    
+    def test_compare_flags_only_real_slowdowns(self):
+        """Medians past both the relative tolerance and the absolute floor regress."""
+        from scripts import bench_storage
+        
+        baseline = {"1000": {"get_user": {"p50_ms": 0.4}, "post_message": {"p50_ms": 2.0}}}
+        results = {"1000": {"get_user": {"p50_ms": 0.62}, "post_message": {"p50_ms": 3.5}},
+                   "5000": {"get_user": {"p50_ms": 9.0}}}
+        
+        regressions = bench_storage.compare(results, baseline, 0.5, min_delta_ms=0.25)
+        assert len(regressions) == 1
+        assert regressions[0].startswith("post_message @ 1000 messages")
+        assert len(bench_storage.compare(results, baseline, 0.25)) == 2
+    
+    @pytest.mark.timeout(60)
+    def test_run_size_reports_every_benchmark(self, temp_db):
+        """A tiny run seeds the database and times each operation."""
+        from scripts import bench_storage
+        
+        results = bench_storage.run_size(temp_db, 200, iterations=2, rounds=1)
+        
+        assert set(results) == set(bench_storage.BENCHMARKS)
+        assert all(row["iterations"] == 2 and 0 < row["p50_ms"] <= row["max_ms"]
+                   for row in results.values())
+        assert bbs_server.get_user("bench0") is not None
+    
+    def test_seeded_database_is_reused(self, temp_db):
+        """A rerun trims what the write benchmarks added instead of reseeding."""
+        import sqlite3
+        from scripts import bench_storage
+        
+        bench_storage.run_size(temp_db, 200, iterations=2, rounds=1)
+        conn = sqlite3.connect(temp_db)
+        assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] > 200
+        conn.execute("UPDATE messages SET body = 'kept from the first seed' WHERE id = 1")
+        conn.commit()
+        
+        assert bench_storage.seed_database(temp_db, 200)[:1] == ["bench0"]
+        assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 200
+        assert conn.execute("SELECT COUNT(*) FROM users WHERE username LIKE 'new%'").fetchone()[0] == 0
+        assert conn.execute("SELECT body FROM messages WHERE id = 1").fetchone()[0] == "kept from the first seed"
+        conn.close()
+
+class TestSoak:
+    """Test the soak runner's leak detection against an in-process server."""
+    
+    def _args(self):
+        from scripts import soak
+        return soak.parse_arguments([
+            "--duration", "2", "--users", "2", "--actions", "2", "--think", "0.01",
+            "--interval", "0.5", "--warmup", "0.5", "--seed", "3", "--timeout", "10",
+        ])
+    
+    def test_leak_findings(self):
+        """Leftover session state, surviving tasks and excess growth are all reported."""
+        from scripts import soak
+        
+        idle = {"active_users": 0, "sessions": 0, "push_subscribers": 0, "tasks": 2}
+        assert soak.leak_findings(idle, dict(idle), 1024, 2**20) == []
+        
+        leaky = dict(idle, active_users=3, tasks=5)
+        findings = soak.leak_findings(idle, leaky, 2 * 2**20, 2**20)
+        assert len(findings) == 3
+        assert findings[0].startswith("active_users still holds 3")
+        assert soak.growth_per_hour([{"elapsed_sec": 0, "traced_bytes": 0},
+                                     {"elapsed_sec": 60, "traced_bytes": 1000}]) == pytest.approx(60000)
+    
+    @pytest.mark.asyncio
+    @pytest.mark.timeout(60)
+    async def test_clean_run_has_no_findings(self, temp_db):
+        """Churning sessions leave nothing behind once they have all closed."""
+        from scripts import soak
+        
+        args = self._args()
+        report = await soak.run_soak(args, soak.loadgen.parse_mix(args.mix))
+        
+        assert report["sessions"] > 0 and report["errors"] == 0
+        assert len(report["samples"]) >= 3
+        assert report["final"]["state"]["sessions"] == 0
+        assert report["findings"] == []
+    
+    @pytest.mark.asyncio
+    @pytest.mark.timeout(60)
+    async def test_detects_leaked_presence(self, temp_db, monkeypatch):
+        """A logout path that forgets ACTIVE_USERS is caught."""
+        from scripts import soak
+        
+        async def forget(username):
+            pass
+        monkeypatch.setattr(bbs_server, "remove_active_user", forget)
+        monkeypatch.setattr(bbs_server, "ACTIVE_USERS", bbs_server.PresenceIndex())
+        
+        args = self._args()
+        report = await soak.run_soak(args, soak.loadgen.parse_mix(args.mix))
+        
+        assert any(line.startswith("active_users still holds") for line in report["findings"])
+
+class TestReplay:
+    """Test replaying recorded transcripts against an in-process server."""
+    
+    def _write(self, path, *sessions):
+        import json
+        lines = [{"format": "bbs-transcript", "version": 1, "started": "2026-01-01T00:00:00+00:00"}]
+        path.write_text("".join(json.dumps(entry) + "\n" for entry in lines + list(sessions)))
+        return str(path)
+    
+    def test_load_and_rename(self, tmp_path):
+        """Sessions come back ordered by offset; usernames map to stable aliases."""
+        from scripts import replay
+        
+        path = self._write(tmp_path / "t.jsonl",
+                           {"at": 50, "lines": [[0, "bob"], [5, None]]},
+                           {"at": 10, "lines": [[0, "alice"], [5, None]]},
+                           {"at": 90, "lines": [[0, "bob"], [5, None]]})
+        sessions = replay.load_transcripts([path])
+        assert [s["at"] for s in sessions] == [10, 50, 90]
+        
+        assert replay.rename_users(sessions, "r") == {"alice": "r0", "bob": "r1"}
+        assert [s["lines"][0][1] for s in sessions] == ["r0", "r1", "r1"]
+        
+        (tmp_path / "other.jsonl").write_text('{"hello": 1}\n')
+        with pytest.raises(ValueError):
+            replay.load_transcripts([str(tmp_path / "other.jsonl")])
+    
+    @pytest.mark.asyncio
+    async def test_prompt_ignores_message_text(self):
+        """Output that happens to end in ": " or "> " is not taken for a prompt."""
+        from scripts import replay
+        
+        session = replay.ReplaySession("127.0.0.1", 0, 5)
+        session.reader = asyncio.StreamReader()
+        session.reader.feed_data(b"[7] alice: ")
+        asyncio.get_running_loop().call_later(0.05, session.reader.feed_data,
+                                              b"hi\r\n> quoted\r\n> ")
+        asyncio.get_running_loop().call_later(0.1, session.reader.feed_data,
+                                              b"\r\n[N]ext [Q]uit: ")
+        
+        assert await session.prompt() == b"[N]ext [Q]uit: "
+    
+    @pytest.mark.asyncio
+    @pytest.mark.timeout(30)
+    async def test_replay_drives_the_server(self, bbs_server_instance, temp_db, tmp_path):
+        """Replayed input reaches the server in order and is timed per action."""
+        from scripts import replay
+        
+        path = self._write(tmp_path / "t.jsonl",
+                           {"at": 0, "lines": [[0, "alice"], [300, None], [900, "2"],
+                                               [0, "replayed post"], [400, "4"]]},
+                           {"at": 20, "lines": [[0, "bob"], [200, None], [700, "1"], [50, "q"]]})
+        args = replay.parse_arguments([path, "--port", str(bbs_server_instance), "--speed", "0",
+                                       "--timeout", "10"])
+        stats = await replay.run_replay(args, replay.load_transcripts(args.transcripts))
+        summary = stats.summary()
+        
+        assert not stats.errors
+        assert summary["actions"]["post"]["count"] == 1
+        assert summary["actions"]["read"]["count"] == 1
+        assert summary["actions"]["password"]["count"] == 2
+        assert [row[1] for row in bbs_server.list_messages()] == ["replayed post"]
@@ -2,6 +2,7 @@
 import pytest
 import asyncio
 import sys
+import time
 from pathlib import Path
 
 # Add the parent directory to the path so we can import bbs_server
@@ -208,4 +209,725 @@ class TestServerIntegration:
         
         # Should get login failed
         response = bbs_client.recv_until("Goodbye", timeout=3)
-        assert "Login failed" in response or "Goodbye" in response
\ No newline at end of file
+        assert "Login failed" in response or "Goodbye" in response
+
+class TestPresenceIndex:
+    """Test the sorted presence index behind Who's Online."""
+    
+    def test_sorted_order_and_membership(self):
+        """Members iterate in sorted order with set semantics."""
+        index = bbs_server.PresenceIndex()
+        for name in ["mallory", "alice", "carol", "bob", "alice"]:
+            index.add(name)
+        
+        assert len(index) == 4
+        assert list(index) == ["alice", "bob", "carol", "mallory"]
+        assert "carol" in index
+        
+        index.discard("bob")
+        index.discard("nonexistent")
+        assert list(index) == ["alice", "carol", "mallory"]
+    
+    def test_slice_and_rank_match_sorted_list(self):
+        """Positional slices agree with a plain sorted list."""
+        index = bbs_server.PresenceIndex()
+        names = [f"user{i:04d}" for i in range(500)]
+        for name in reversed(names):
+            index.add(name)
+        for name in names[::3]:
+            index.discard(name)
+        expected = [n for i, n in enumerate(names) if i % 3]
+        
+        assert list(index) == expected
+        assert index.slice(0, 20) == expected[:20]
+        assert index.slice(100, 137) == expected[100:137]
+        assert index.slice(len(expected) - 5, len(expected) + 10) == expected[-5:]
+        assert index.rank("user0100") == sum(1 for n in expected if n < "user0100")
+    
+    def test_prefix_range(self):
+        """Prefix filtering returns the matching contiguous range."""
+        index = bbs_server.PresenceIndex()
+        for name in ["alice", "albert", "bob", "alfred", "zed"]:
+            index.add(name)
+        
+        lo, hi = index.prefix_range("al")
+        assert index.slice(lo, hi) == ["albert", "alfred", "alice"]
+        assert index.prefix_range("") == (0, 5)
+        lo, hi = index.prefix_range("q")
+        assert hi - lo == 0
+    
+    @pytest.mark.asyncio
+    async def test_who_page(self):
+        """who_page pages through the index and clamps the page number."""
+        async with bbs_server.ACTIVE_LOCK:
+            bbs_server.ACTIVE_USERS.clear()
+        for i in range(25):
+            await bbs_server.add_active_user(f"user{i:02d}")
+        await bbs_server.add_active_user("zoe")
+        
+        total, matched, page, names = await bbs_server.who_page(page=1, page_size=10)
+        assert (total, matched, page) == (26, 26, 1)
+        assert names == [f"user{i:02d}" for i in range(10, 20)]
+        
+        total, matched, page, names = await bbs_server.who_page("user", page=9, page_size=10)
+        assert (matched, page) == (25, 2)
+        assert names == [f"user{i:02d}" for i in range(20, 25)]
+        
+        async with bbs_server.ACTIVE_LOCK:
+            bbs_server.ACTIVE_USERS.clear()
+
+
+class TestMessageHub:
+    """Test the in-process pub/sub hub used for live message push."""
+    
+    @pytest.mark.asyncio
+    async def test_publish_skips_author(self):
+        """Subscribers receive events except for their own posts."""
+        hub = bbs_server.MessageHub()
+        alice = hub.subscribe("alice")
+        bob = hub.subscribe("bob")
+        
+        hub.publish({"id": 1, "author": "alice", "body": "hi", "posted_at": "t"})
+        
+        assert alice.queue.empty()
+        event = await bob.get()
+        assert event["body"] == "hi"
+        
+        hub.unsubscribe(bob)
+        hub.publish({"id": 2, "author": "alice", "body": "again", "posted_at": "t"})
+        assert bob.queue.empty()
+        assert len(hub) == 1
+    
+    @pytest.mark.asyncio
+    async def test_drop_oldest_policy(self):
+        """A full drop-oldest queue keeps the newest events."""
+        sub = bbs_server.Subscription("reader", maxsize=3, policy="drop-oldest")
+        for i in range(5):
+            sub.offer({"id": i, "author": "x"})
+        
+        ids = [(await sub.get())["id"] for _ in range(3)]
+        assert ids == [2, 3, 4]
+        assert sub.dropped == 2
+    
+    @pytest.mark.asyncio
+    async def test_coalesce_policy(self):
+        """A full coalescing queue collapses into one summary event."""
+        sub = bbs_server.Subscription("reader", maxsize=3, policy="coalesce")
+        for i in range(5):
+            sub.offer({"id": i, "author": "x"})
+        
+        assert sub.queue.qsize() == 2
+        summary = await sub.get()
+        assert summary == {"coalesced": 4}
+        assert (await sub.get())["id"] == 4
+        assert sub.dropped == 4
+    
+    def test_post_message_publishes(self, temp_db):
+        """post_message fans the stored post out through the global hub."""
+        sub = bbs_server.HUB.subscribe("listener")
+        try:
+            message_id = bbs_server.post_message("poster", "pushed body")
+            event = sub.queue.get_nowait()
+            assert event["id"] == message_id
+            assert event["author"] == "poster"
+            assert event["body"] == "pushed body"
+        finally:
+            bbs_server.HUB.unsubscribe(sub)
+    
+    def test_publish_is_scoped_to_board(self):
+        """Subscribers only hear about posts on the board they are reading."""
+        hub = bbs_server.MessageHub()
+        general = hub.subscribe("alice")
+        tech = hub.subscribe("bob", board_id=2)
+        
+        hub.publish({"id": 1, "board_id": 2, "author": "carol", "body": "hi", "posted_at": 0})
+        
+        assert general.queue.empty()
+        assert tech.queue.qsize() == 1
+    
+    def test_board_switch_forgets_queued_events(self):
+        """Events queued for the old board are not delivered after a switch."""
+        hub = bbs_server.MessageHub()
+        sub = hub.subscribe("alice")
+        hub.publish({"id": 1, "author": "carol", "body": "hi", "posted_at": 0})
+        
+        sub.set_board(2)
+        hub.publish({"id": 2, "board_id": 2, "author": "carol", "body": "hi", "posted_at": 0})
+        
+        assert sub.queue.qsize() == 1
+        assert sub.queue.get_nowait()["id"] == 2
+
+
+class FakeWriter:
+    """Collects what a handler writes, for driving handlers without sockets."""
+    
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+    
+    def write(self, data):
+        self.data += data
+    
+    def close(self):
+        self.closed = True
+    
+    async def drain(self):
+        pass
+    
+    def text(self):
+        return self.data.decode("utf-8")
+
+
+def make_reader(*lines):
+    reader = asyncio.StreamReader()
+    for line in lines:
+        reader.feed_data(line.encode("utf-8") + b"\r\n")
+    reader.feed_eof()
+    return reader
+
+
+class TestMessageEditor:
+    """Test the bounded multi-line message editor."""
+    
+    def test_buffer_enforces_byte_limit(self):
+        """Lines that would push the message past the limit are refused."""
+        buf = bbs_server.MessageBuffer(max_bytes=10)
+        assert buf.append("hello")
+        assert buf.append("abcd")      # "hello\nabcd" is exactly 10 bytes
+        assert not buf.append("x")
+        assert buf.text() == "hello\nabcd"
+        
+        assert not buf.replace(1, "abcde")
+        buf.delete(0)
+        assert buf.replace(0, "abcdefghij")
+        assert buf.remaining() == 0
+        
+        buf.clear()
+        assert len(buf) == 0 and buf.size == 0
+    
+    @pytest.mark.asyncio
+    async def test_editor_commands(self):
+        """The editor supports delete, edit and finishes on a lone dot."""
+        reader = make_reader("first", "second", "third", "/del 2", "/edit 1", "FIRST", "/list", ".")
+        writer = FakeWriter()
+        
+        body = await bbs_server.run_editor(reader, writer, max_bytes=100)
+        
+        assert body == "FIRST\nthird"
+        assert "  2: third" in writer.text()
+    
+    @pytest.mark.asyncio
+    async def test_editor_rejects_overflow_and_abort(self):
+        """Oversized input is rejected line by line; /abort discards."""
+        writer = FakeWriter()
+        body = await bbs_server.run_editor(make_reader("a" * 8, "b" * 8, "."), writer, max_bytes=10)
+        assert body == "a" * 8
+        assert "Line rejected" in writer.text()
+        
+        body = await bbs_server.run_editor(make_reader("text", "/abort"), FakeWriter(), max_bytes=10)
+        assert body == ""
+        
+        body = await bbs_server.run_editor(make_reader("text"), FakeWriter(), max_bytes=10)
+        assert body is None
+    
+    @pytest.mark.asyncio
+    async def test_prompt_body_single_line(self):
+        """The default prompt still accepts a single line."""
+        body = await bbs_server.prompt_body(make_reader("  one liner  "), FakeWriter(), "message")
+        assert body == "one liner"
+        
+        body = await bbs_server.prompt_body(make_reader("/edit", "line 1", "line 2", "."), FakeWriter(), "message")
+        assert body == "line 1\nline 2"
+
+
+class TestPostGuard:
+    """Test per-user flood control and duplicate rejection."""
+    
+    def test_sliding_window_rate_limit(self):
+        """Posts beyond the limit are refused until the window slides."""
+        guard = bbs_server.PostGuard(max_posts=3, window=10, duplicate_window=0)
+        for i in range(3):
+            assert guard.check("spammer", f"post {i}", now=100 + i) is None
+        
+        assert guard.check("spammer", "post 3", now=105) == "rate"
+        assert guard.retry_after("spammer", now=105) == pytest.approx(5)
+        assert guard.check("someone_else", "post", now=105) is None
+        
+        # The oldest post leaves the window at t=110
+        assert guard.check("spammer", "post 4", now=110.5) is None
+        assert guard.stats()["rate_limited"] == 1
+    
+    def test_duplicate_bodies_rejected(self):
+        """Exact duplicates (ignoring surrounding whitespace) are refused for a while."""
+        guard = bbs_server.PostGuard(max_posts=100, window=10, duplicate_window=60)
+        assert guard.check("alice", "buy now", now=0) is None
+        assert guard.check("alice", "  buy now ", now=1) == "duplicate"
+        assert guard.check("bob", "buy now", now=1) is None
+        assert guard.check("alice", "buy now", now=61) is None
+        assert guard.stats()["duplicates"] == 1
+    
+    def test_sweep_forgets_idle_users(self):
+        """Expired per-user state is dropped so the guard doesn't grow forever."""
+        guard = bbs_server.PostGuard(max_posts=5, window=10, duplicate_window=20)
+        for i in range(50):
+            guard.check(f"user{i}", "hello", now=0)
+        assert guard.stats()["tracked_users"] == 50
+        
+        guard.sweep(now=30)
+        assert guard.stats()["tracked_users"] == 0
+
+
+class TestTerminalWidth:
+    """Test NAWS parsing and width-aware message wrapping."""
+    
+    @pytest.mark.asyncio
+    async def test_naws_is_stripped_and_recorded(self):
+        """Negotiation bytes never reach the line and set the window size."""
+        raw = asyncio.StreamReader()
+        # WILL NAWS, then NAWS 80x10 (10 == '\n', which must not end the line)
+        raw.feed_data(bytes([255, 251, 31, 255, 250, 31, 0, 80, 0, 10, 255, 240]))
+        raw.feed_data(b"alice\r\n")
+        raw.feed_data(bytes([255, 250, 31, 0, 132, 0, 50, 255, 240]) + b"next\r\n")
+        raw.feed_eof()
+        reader = bbs_server.TelnetReader(raw)
+        
+        assert await bbs_server.recv_line(reader) == "alice"
+        assert (reader.width, reader.height) == (80, 10)
+        assert await bbs_server.recv_line(reader) == "next"
+        assert (reader.width, reader.height) == (132, 50)
+    
+    @pytest.mark.asyncio
+    async def test_unterminated_subnegotiation_is_bounded(self):
+        """IAC SB without IAC SE is abandoned instead of swallowing the input."""
+        raw = asyncio.StreamReader()
+        raw.feed_data(bytes([255, 250, 24]))
+        for _ in range(50):
+            raw.feed_data(b"y" * 4096 + b"\r\n")
+        raw.feed_data(b"alice\r\nnext\r\n")
+        raw.feed_eof()
+        reader = bbs_server.TelnetReader(raw)
+        
+        first = await bbs_server.recv_line(reader)
+        assert len(reader._sb) <= reader.SB_MAX_BYTES
+        assert first and set(first) == {"y"}
+        lines = [await bbs_server.recv_line(reader) for _ in range(51)]
+        assert lines[-2:] == ["alice", "next"]
+        assert reader.terminal_type is None
+    
+    @pytest.mark.asyncio
+    async def test_bare_iac_keeps_line_end(self):
+        """IAC before a line end neither eats it nor lets a line grow unbounded."""
+        raw = asyncio.StreamReader()
+        for _ in range(5):
+            raw.feed_data(b"A" * 4000 + bytes([255]) + b"\n")
+        raw.feed_data(b"x" * (bbs_server.MAX_LINE_BYTES + 1) + b"\r\nalice\r\n")
+        raw.feed_eof()
+        reader = bbs_server.TelnetReader(raw)
+        
+        lines = [await bbs_server.recv_line(reader) for _ in range(7)]
+        assert lines[:5] == ["A" * 4000] * 5
+        assert lines[5:] == ["", "alice"]
+    
+    def test_escaped_iac_is_data(self):
+        """IAC IAC stands for a literal 0xFF byte."""
+        reader = bbs_server.TelnetReader(None)
+        assert reader._filter(bytes([65, 255, 255, 66])) == bytes([65, 255, 66])
+    
+    def test_wrap_is_cached_per_width(self):
+        """Wrapped lines fit the width and are computed once per width."""
+        bbs_server.clear_caches()
+        body = "word " * 40
+        text = bbs_server.wrap_message(7, "alice", body, 0, 40)
+        
+        lines = text.split("\r\n")[:-1]
+        assert len(lines) > 1
+        assert all(len(line) <= 40 for line in lines)
+        assert all(line.startswith("    ") for line in lines[1:])
+        
+        misses = bbs_server.WRAP_CACHE.misses
+        assert bbs_server.wrap_message(7, "alice", body, 0, 40) is text
+        assert bbs_server.WRAP_CACHE.misses == misses
+        assert bbs_server.wrap_message(7, "alice", body, 0, 60) != text
+
+
+class TestCharsets:
+    """Test per-session charset negotiation and encoding."""
+    
+    @pytest.mark.asyncio
+    async def test_charset_negotiation(self):
+        """WILL CHARSET is answered and an accepted charset is adopted."""
+        raw = asyncio.StreamReader()
+        raw.feed_data(bytes([255, 251, 42]))
+        raw.feed_data(bytes([255, 250, 42, 2]) + b"IBM437" + bytes([255, 240]) + b"bob\r\n")
+        raw.feed_eof()
+        writer = FakeWriter()
+        reader = bbs_server.TelnetReader(raw, writer)
+        
+        assert await bbs_server.recv_line(reader) == "bob"
+        assert writer.data == bbs_server.TELNET_CHARSET_REQUEST
+        assert reader.charset == "cp437"
+    
+    def test_terminal_type_implies_charset(self):
+        """An ANSI terminal type selects CP437 unless CHARSET was accepted."""
+        reader = bbs_server.TelnetReader(None)
+        reader._filter(bytes([255, 250, 24, 0]) + b"ANSI" + bytes([255, 240]))
+        assert reader.terminal_type == "ANSI"
+        assert reader.charset == "cp437"
+    
+    def test_encode_text_fallbacks(self):
+        """Characters a legacy charset lacks are translated, not dropped."""
+        text = "“déjà vu” — ő"
+        assert bbs_server.encode_text(text, "cp437") == '"déjà vu" -- o'.encode("cp437")
+        assert bbs_server.encode_text(text, "iso8859-1") == '"déjà vu" -- o'.encode("latin-1")
+        assert bbs_server.encode_text("中", "cp437") == b"?"
+        assert bbs_server.normalize_charset("Latin-1") == "iso8859-1"
+        assert bbs_server.normalize_charset("koi8-r") is None
+    
+    @pytest.mark.asyncio
+    async def test_screens_encoded_once_per_charset(self):
+        """Shared screens come from the per-charset cache on repeat sends."""
+        bbs_server.clear_caches()
+        first, second = FakeWriter(), FakeWriter()
+        first.charset = second.charset = "cp437"
+        
+        await bbs_server.send_screen(first, [bbs_server.MAIN_MENU, "é\r\n"])
+        misses = bbs_server.SCREEN_CACHE.misses
+        await bbs_server.send_screen(second, [bbs_server.MAIN_MENU, "é\r\n"])
+        
+        assert bbs_server.SCREEN_CACHE.misses == misses
+        assert second.data == first.data
+        assert first.data.endswith("é\r\n".encode("cp437"))
+
+
+class TestMetrics:
+    """Test the metrics registry and its HTTP listener."""
+    
+    def test_histogram_and_counter_rendering(self):
+        """Observations land in cumulative buckets with sum and count."""
+        metrics = bbs_server.Metrics()
+        metrics.observe("op_seconds", 0.003, op="read")
+        metrics.observe("op_seconds", 2.0, op="read")
+        metrics.inc("bytes_total", 10)
+        metrics.inc("bytes_total", 5)
+        text = metrics.render()
+        
+        assert "# TYPE op_seconds histogram" in text
+        assert 'op_seconds_bucket{op="read",le="0.0025"} 0' in text
+        assert 'op_seconds_bucket{op="read",le="0.005"} 1' in text
+        assert 'op_seconds_bucket{op="read",le="+Inf"} 2' in text
+        assert 'op_seconds_count{op="read"} 2' in text
+        assert "# TYPE bytes_total counter\nbytes_total 15" in text
+    
+    @pytest.mark.asyncio
+    async def test_menu_action_excludes_input_wait(self):
+        """Time blocked in recv_line is left out of the action's timer."""
+        raw = asyncio.StreamReader()
+        asyncio.get_running_loop().call_later(0.2, raw.feed_data, b"hello\r\n")
+        metrics = bbs_server.Metrics()
+        with metrics.time("bbs_menu_action_seconds", action="post") as timer:
+            token = bbs_server.ACTION_TIMER.set(timer)
+            try:
+                line = await bbs_server.recv_line(raw)
+            finally:
+                bbs_server.ACTION_TIMER.reset(token)
+        
+        assert line == "hello"
+        assert timer.elapsed < 0.1
+    
+    def test_storage_calls_are_timed(self, temp_db):
+        """Decorated storage functions record a histogram per function."""
+        bbs_server.METRICS.clear()
+        bbs_server.post_message("alice", "hello")
+        bbs_server.list_messages()
+        text = bbs_server.METRICS.render()
+        
+        assert 'bbs_storage_seconds_count{op="post_message"} 1' in text
+        assert 'bbs_storage_seconds_count{op="list_messages"} 1' in text
+        assert 'bbs_post_guard_total{result="accepted"}' in text
+        assert bbs_server.list_messages.__name__ == "list_messages"
+    
+    def test_cache_hits_are_not_storage_calls(self, temp_db):
+        """A cached board feed counts a hit and times only the query behind a miss."""
+        bbs_server.METRICS.clear()
+        bbs_server.clear_caches()
+        bbs_server.latest_messages(limit=5)
+        bbs_server.latest_messages(limit=5)
+        text = bbs_server.METRICS.render()
+        
+        assert 'bbs_storage_seconds_count{op="list_messages_before"} 1' in text
+        assert 'op="latest_messages"' not in text
+        assert 'bbs_cache_lookups_total{cache="board_latest",result="hit"} 1' in text
+        assert 'bbs_cache_lookups_total{cache="board_latest",result="miss"} 1' in text
+        
+        bbs_server.list_messages_after(0)
+        text = bbs_server.METRICS.render()
+        assert 'bbs_storage_seconds_count{op="list_messages_since"} 1' in text
+        assert 'op="list_messages_after"' not in text
+    
+    def test_read_marks_time_only_sql(self, temp_db):
+        """Pending read marks are hits; an empty flush runs no SQL and is not timed."""
+        bbs_server.METRICS.clear()
+        bbs_server.PENDING_READ_MARKS.clear()
+        bbs_server.get_last_read_id("alice")
+        bbs_server.mark_read("alice", 5)
+        bbs_server.get_last_read_id("alice")
+        assert bbs_server.flush_read_marks() == 1
+        assert bbs_server.flush_read_marks() == 0
+        text = bbs_server.METRICS.render()
+        
+        assert 'bbs_storage_seconds_count{op="load_last_read_id"} 1' in text
+        assert 'bbs_storage_seconds_count{op="write_read_marks"} 1' in text
+        assert 'op="get_last_read_id"' not in text and 'op="flush_read_marks"' not in text
+        assert 'bbs_cache_lookups_total{cache="read_marks",result="hit"} 1' in text
+    
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self):
+        """GET /metrics returns the exposition; other paths are 404."""
+        server = await asyncio.start_server(bbs_server.metrics_handler, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        
+        async def get(path):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+        
+        try:
+            ok = await get("/metrics")
+            missing = await get("/nope")
+        finally:
+            server.close()
+            await server.wait_closed()
+        
+        assert ok.startswith("HTTP/1.0 200 OK")
+        assert "# TYPE bbs_active_users gauge" in ok
+        assert missing.startswith("HTTP/1.0 404")
+
+
+def _block_the_loop(seconds):
+    time.sleep(seconds)
+
+
+class TestLoopWatchdog:
+    """Test event loop lag detection."""
+    
+    @pytest.mark.asyncio
+    async def test_blocking_call_is_sampled(self):
+        """A blocking call on the loop is caught with its stack."""
+        bbs_server.METRICS.clear()
+        watchdog = bbs_server.LoopWatchdog(threshold=0.05, interval=0.02)
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.05)
+            _block_the_loop(0.3)
+            await asyncio.sleep(0.05)
+        finally:
+            watchdog.stop()
+        
+        assert len(watchdog.stalls) == 1
+        assert watchdog.stalls[0]["stack"][-1].name == "_block_the_loop"
+        assert watchdog.max_lag >= 0.2
+        assert 'bbs_loop_stalls_total{function="_block_the_loop (test_server.py)"} 1' in bbs_server.METRICS.render()
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestProfiler:
+    """Test the on-demand profiler."""
+    
+    @pytest.mark.asyncio
+    async def test_cprofile_capture(self, tmp_path):
+        """A cProfile capture writes a loadable pstats file."""
+        import pstats
+        profiler = bbs_server.Profiler(directory=str(tmp_path), mode="cprofile")
+        path = profiler.toggle(seconds=60)
+        assert profiler.running
+        _busy(0.01)
+        assert profiler.toggle() == path
+        assert not profiler.running
+        
+        stats = pstats.Stats(path)
+        assert any(func[2] == "_busy" for func in stats.stats)
+    
+    @pytest.mark.asyncio
+    async def test_sampled_capture_stops_itself(self, tmp_path):
+        """Sample mode writes collapsed stacks when its time is up."""
+        profiler = bbs_server.Profiler(directory=str(tmp_path), mode="sample", sample_hz=200)
+        path = profiler.start(seconds=0.2)
+        _busy(0.1)
+        await asyncio.sleep(0.2)
+        
+        assert not profiler.running
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert any("_busy (test_server.py" in line for line in lines)
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+class TestStructuredLogging:
+    """Test JSON-lines logging through the background listener."""
+    
+    def test_json_lines_with_session_ids_and_sampling(self):
+        """Events become JSON lines tagged with the session id; sampling drops."""
+        import contextvars
+        import io
+        import json
+        import logging
+        
+        stream = io.StringIO()
+        listener = bbs_server.setup_logging("INFO", stream)
+        
+        def in_session():
+            bbs_server.SESSION_ID.set(42)
+            bbs_server.log_event("login", user="alice")
+        
+        try:
+            contextvars.copy_context().run(in_session)
+            bbs_server.log_event("menu_action", sample=0.0, action="read")
+            bbs_server.log_event("menu_action", sample=1.0, action="post")
+            bbs_server.log_event("noisy", logging.DEBUG)
+        finally:
+            listener.stop()
+            for handler in list(bbs_server.LOG.handlers):
+                bbs_server.LOG.removeHandler(handler)
+        
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert [line["event"] for line in lines] == ["login", "menu_action"]
+        assert lines[0]["sid"] == 42 and lines[0]["user"] == "alice"
+        assert lines[0]["level"] == "info" and lines[0]["ts"].endswith("Z")
+        assert "sid" not in lines[1]
+        assert lines[1]["action"] == "post" and lines[1]["sample_rate"] == 1.0
+
+
+class TestTracing:
+    """Test sampled span export."""
+    
+    @pytest.mark.asyncio
+    async def test_traced_session_exports_nested_spans(self, temp_db, tmp_path):
+        """Spans from a traced session load as a Chrome trace on its track."""
+        import json
+        path = tmp_path / "trace.json"
+        listener = bbs_server.setup_tracing(str(path))
+        try:
+            bbs_server.SESSION_ID.set(5)
+            bbs_server.TRACING.set(True)
+            bbs_server.trace_thread_name("session 5 (alice)")
+            with bbs_server.trace_span("post", "handler"):
+                bbs_server.post_message("alice", "hello")
+                await bbs_server.send(FakeWriter(), "Posted.\r\n")
+            bbs_server.TRACING.set(False)
+            with bbs_server.trace_span("untraced", "handler"):
+                bbs_server.list_messages()
+        finally:
+            listener.stop()
+            for handler in list(bbs_server.TRACE.handlers):
+                bbs_server.TRACE.removeHandler(handler)
+                handler.close()
+        
+        text = path.read_text()
+        assert text.startswith("[\n")
+        events = json.loads(text.rstrip().rstrip(",") + "]")
+        by_name = {event["name"]: event for event in events}
+        
+        assert set(by_name) == {"thread_name", "post", "post_message", "send"}
+        assert all(event["tid"] == 5 for event in events)
+        assert by_name["post_message"]["cat"] == "db"
+        assert by_name["send"]["args"] == {"bytes": 9}
+        post, send = by_name["post"], by_name["send"]
+        assert post["ts"] <= send["ts"] and send["ts"] + send["dur"] <= post["ts"] + post["dur"] + 1
+    
+    def test_untraced_spans_are_shared_no_ops(self):
+        """Outside a sampled session no span object is created."""
+        assert bbs_server.trace_span("x") is bbs_server.NO_SPAN
+
+
+class TestAdminConsole:
+    """Test admin commands against in-memory session state."""
+    
+    @pytest.fixture
+    def sessions(self):
+        bbs_server.SESSIONS.clear()
+        alice = bbs_server.Session(bbs_server.TelnetReader(None), FakeWriter(), "alice")
+        bob = bbs_server.Session(bbs_server.TelnetReader(None), FakeWriter(), "bob")
+        alice.sid, alice.peer = 1, ("127.0.0.1", 5000)
+        bob.sid = 2
+        bob.writer.charset = "cp437"
+        bob.at_menu.set()
+        bbs_server.SESSIONS.update({1: alice, 2: bob})
+        yield alice, bob
+        bbs_server.SESSIONS.clear()
+    
+    def test_sessions_listing(self, sessions):
+        """Every session is listed with idle time and buffered output."""
+        text = bbs_server.admin_command("sessions")
+        lines = text.splitlines()
+        
+        assert len(lines) == 4 and lines[-1] == "2 session(s)"
+        assert "alice" in lines[1] and "127.0.0.1:5000" in lines[1] and lines[1].endswith("busy")
+        assert "bob" in lines[2] and lines[2].endswith("menu")
+    
+    def test_kick_and_broadcast(self, sessions):
+        """Kick closes only the target; broadcast reaches everyone in their charset."""
+        alice, bob = sessions
+        assert bbs_server.admin_command("broadcast Back in 5 – sorry") == "sent to 2 session(s)\n"
+        assert "*** SYSOP: Back in 5 – sorry" in alice.writer.text()
+        assert b"*** SYSOP: Back in 5 - sorry" in bob.writer.data
+        
+        assert bbs_server.admin_command("kick 2").startswith("kicked bob")
+        assert bob.writer.closed and not alice.writer.closed
+        assert bbs_server.admin_command("kick 9").startswith("error:")
+    
+    def test_flush_and_unknown(self, sessions):
+        """flush empties the caches; unknown commands are reported."""
+        bbs_server.clear_caches()
+        bbs_server.render_message(1, "alice", "hi", 0)
+        assert bbs_server.admin_command("flush").startswith("cleared 1 ")
+        assert len(bbs_server.MESSAGE_LINE_CACHE) == 0
+        assert bbs_server.admin_command("metrics").startswith("# ")
+        assert bbs_server.admin_command("reboot").startswith("error: unknown command")
+
+
+class TestSessionRecording:
+    """Test opt-in transcripts of session input."""
+    
+    @pytest.mark.asyncio
+    async def test_login_is_recorded_without_password(self, temp_db, tmp_path, monkeypatch):
+        """Lines are kept with their gaps; the password only as a placeholder."""
+        import json
+        recorder = bbs_server.SessionRecorder(str(tmp_path))
+        monkeypatch.setattr(bbs_server, "RECORDER", recorder)
+        path = recorder.start()
+        transcript = recorder.transcript()
+        token = bbs_server.TRANSCRIPT.set(transcript)
+        try:
+            reader = make_reader("alice", "s3cret", "1")
+            assert await bbs_server.handle_login(reader, FakeWriter()) == "alice"
+            assert await bbs_server.recv_line(reader) == "1"
+        finally:
+            bbs_server.TRANSCRIPT.reset(token)
+        recorder.save(transcript)
+        assert recorder.stop() == path
+        
+        text = open(path).read()
+        header, record = [json.loads(line) for line in text.splitlines()]
+        assert "s3cret" not in text
+        assert header["format"] == "bbs-transcript" and header["version"] == 1
+        assert [line for _, line in record["lines"]] == ["alice", None, "1"]
+        assert all(isinstance(gap, int) and gap >= 0 for gap, _ in record["lines"])
+    
+    def test_off_until_started(self, tmp_path, monkeypatch):
+        """No transcripts without a running recorder; the admin console toggles it."""
+        recorder = bbs_server.SessionRecorder(str(tmp_path))
+        monkeypatch.setattr(bbs_server, "RECORDER", recorder)
+        assert recorder.transcript() is None
+        
+        assert bbs_server.admin_command("record").startswith("recording to ")
+        assert recorder.transcript().lines == []
+        reply = bbs_server.admin_command("record")
+        assert reply.startswith("wrote ") and not recorder.running
+        assert len(list(tmp_path.glob("sessions-*.jsonl"))) == 1